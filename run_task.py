@@ -97,16 +97,10 @@ async def main():
         # 4. 测试节点延迟
         console.print("[bold cyan]正在测试节点延迟...[/bold cyan]")
         
-        # 获取最大节点数限制
-        max_nodes = config.get('latency_test', {}).get('max_nodes', 300)
-        if len(unique_proxies) > max_nodes:
-            logger.warning(f"节点数量({len(unique_proxies)})超过最大限制({max_nodes})，将随机选择{max_nodes}个节点进行测试")
-            console.print(f"[bold yellow]警告: 节点数量过多，将只测试{max_nodes}个节点[/bold yellow]")
-            import random
-            random.shuffle(unique_proxies)
-            unique_proxies = unique_proxies[:max_nodes]
-        
+        # 节点数超过max_nodes时由LatencyTester按历史表现和来源挑选
         tested_proxies = await latency_tester.test_all_proxies(unique_proxies)
+        if latency_tester.stop_reason == 'deadline':
+            console.print(f"[yellow]延迟测试超过时间上限，跳过 {latency_tester.stats['skipped']} 个未测试的节点[/yellow]")
         console.print(f"[green]延迟测试完成，有效节点数: {len(tested_proxies)}[/green]")
         
         # 5. 生成最终配置文件
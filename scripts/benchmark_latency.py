@@ -0,0 +1,814 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+延迟测试基准脚本 - 在独立进程中模拟一批本地节点（可编程响应延迟、黑洞、RST、慢速TLS等），
+测量LatencyTester的吞吐量、结果准确性以及CPU/内存开销
+不访问任何外部网络，相同的参数和随机种子得到相同的节点集合，可离线重复运行
+"""
+
+import os
+import sys
+import ssl
+import time
+import random
+import shutil
+import socket
+import struct
+import asyncio
+import logging
+import argparse
+import tempfile
+import functools
+import statistics
+import threading
+import subprocess
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 允许从scripts目录直接运行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.latency_tester import LatencyTester
+from utils.probes import ProbeError
+from urllib.parse import urlsplit, parse_qs
+
+from utils.real_delay import AESGCM, ShadowsocksCipher
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# 常量定义
+LISTEN_HOST = '127.0.0.1'
+SLOW_ACCEPT_INTERVAL = 0.2  # 慢速节点每隔多少秒接受一个连接 (秒)
+FLEET_START_TIMEOUT = 120   # 等待模拟节点进程就绪的时间 (秒)
+
+PAYLOAD_CHUNK = 64 * 1024    # 下载测试数据每次写入的大小 (字节)
+BANDWIDTH_RANGE = (256, 8192)  # 转发代理节点的下行带宽范围 (KB/s)
+
+SS_PASSWORD = 'benchmark'
+SS_METHODS = ('aes-128-gcm', 'chacha20-ietf-poly1305')
+
+# 节点类型 -> 预期测试结果是否有效；slow节点取决于SYN重传时机，不参与判定
+EXPECTED_VALID = {
+    'alive': True,
+    'delayed': True,
+    'slow_tls': True,
+    'socks5_proxy': True,
+    'http_proxy': True,
+    'ss_proxy': True,
+    'refused': False,
+    'reset': False,
+    'blackhole': False,
+}
+
+# 真实延迟模式下，只会应答握手、不能转发流量的节点应判为失效
+EXPECTED_VALID_REAL_DELAY = dict(EXPECTED_VALID, alive=False, delayed=False)
+
+
+def _make_certificate(directory):
+    """用openssl生成临时自签名证书，不可用时返回None"""
+    if shutil.which('openssl') is None:
+        return None
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    try:
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+             '-nodes', '-keyout', key, '-out', cert, '-days', '1', '-subj', '/CN=localhost'],
+            check=True, capture_output=True, timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return cert, key
+
+
+async def _read_address(reader, atyp):
+    """从流中读取SOCKS5格式的地址和端口"""
+    if atyp == 0x01:
+        host = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+    elif atyp == 0x04:
+        host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+    else:
+        length = (await reader.readexactly(1))[0]
+        host = (await reader.readexactly(length)).decode('idna')
+    port, = struct.unpack('!H', await reader.readexactly(2))
+    return host, port
+
+
+def _parse_address(data):
+    """解析SOCKS5格式的地址，返回 (host, port, 地址之后的偏移)"""
+    atyp = data[0]
+    if atyp == 0x01:
+        host, offset = socket.inet_ntop(socket.AF_INET, data[1:5]), 5
+    elif atyp == 0x04:
+        host, offset = socket.inet_ntop(socket.AF_INET6, data[1:17]), 17
+    elif atyp == 0x03:
+        length = data[1]
+        host, offset = data[2:2 + length].decode('idna'), 2 + length
+    else:
+        raise ValueError(f"未知的地址类型: {atyp}")
+    port, = struct.unpack('!H', data[offset:offset + 2])
+    return host, port, offset + 2
+
+
+class ListenerFleet:
+    """本地监听端口集合，用于模拟不同状态的节点（运行在独立进程中）
+
+    - alive: SOCKS5应答端，立即回复方法协商
+    - delayed: SOCKS5应答端，收到请求后等待设定的延迟再回复
+    - slow: 接受队列已满，只按固定间隔腾出位置，连接需要等待SYN重传（约1秒）
+    - refused: 端口未监听，立即返回RST
+    - reset: 完成TCP握手后立即以RST关闭连接
+    - blackhole: 接受队列已满且从不腾出，SYN被丢弃直到超时
+    - slow_tls: trojan节点，等待设定的延迟后才进行TLS握手
+    - socks5_proxy / http_proxy / ss_proxy: 真正转发流量的代理，等待设定的延迟后连接本地测试地址，
+      用于真实延迟测试
+    """
+
+    def __init__(self, seed=0, delay_range=(0, 400)):
+        """初始化节点集合
+
+        Args:
+            seed: 随机种子，决定延迟取值和节点顺序
+            delay_range: delayed/slow_tls节点的延迟范围（毫秒）
+        """
+        self.random = random.Random(seed)
+        self.delay_range = delay_range
+        self.sockets = []
+        self.proxies = []
+        self.truth = {}
+        self._responders = []     # (sock, handler)，由asyncio.start_server应答
+        self._tls_listeners = []  # (sock, delay)，自行accept，延迟后再进行TLS握手
+        self._tasks = set()
+        self._stop = threading.Event()
+        self._threads = []
+        self._tempdir = None
+        self._ssl_context = None
+        self.target = None
+
+    def _listen(self, backlog):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((LISTEN_HOST, 0))
+        sock.listen(backlog)
+        self.sockets.append(sock)
+        return sock
+
+    def _fill_backlog(self, sock):
+        """建立一个永不被accept的连接，占满backlog为0的接受队列"""
+        filler = socket.create_connection(sock.getsockname(), timeout=1)
+        self.sockets.append(filler)
+
+    def _drain_slowly(self, sock):
+        sock.settimeout(SLOW_ACCEPT_INTERVAL)
+        while not self._stop.is_set():
+            try:
+                conn, _ = sock.accept()
+                conn.close()
+            except OSError:
+                continue
+            self._stop.wait(SLOW_ACCEPT_INTERVAL)
+
+    def _delay(self):
+        return self.random.randint(*self.delay_range)
+
+    def _bandwidth(self):
+        return self.random.randint(*BANDWIDTH_RANGE)
+
+    def _add(self, kind, port, proxy_type='ss', delay=None, rate=None):
+        name = f"{kind}-{len(self.proxies)}"
+        proxy = {'name': name, 'type': proxy_type, 'server': LISTEN_HOST, 'port': port}
+        if proxy_type == 'trojan':
+            proxy.update({'password': 'benchmark', 'sni': 'localhost'})
+        self.proxies.append(proxy)
+        self.truth[name] = {'kind': kind, 'delay': delay, 'rate': rate}
+
+    def _tls_context(self):
+        if self._ssl_context is None:
+            self._tempdir = tempfile.mkdtemp(prefix='latency-bench-')
+            certificate = _make_certificate(self._tempdir)
+            if certificate is None:
+                return None
+            self._ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._ssl_context.load_cert_chain(*certificate)
+        return self._ssl_context
+
+    def start(self, alive=0, delayed=0, slow=0, refused=0, reset=0, blackhole=0, slow_tls=0,
+              socks5_proxy=0, http_proxy=0, ss_proxy=0):
+        """创建监听端口（应答端由serve启动）
+
+        Args:
+            alive: 正常节点数量
+            delayed: 延迟应答节点数量
+            slow: 慢速接受节点数量
+            refused: 拒绝连接的节点数量
+            reset: 连接后立即RST的节点数量
+            blackhole: 黑洞节点数量
+            slow_tls: 慢速TLS节点数量
+            socks5_proxy: 转发流量的SOCKS5代理数量
+            http_proxy: 转发流量的HTTP代理数量
+            ss_proxy: 转发流量的shadowsocks代理数量
+
+        Returns:
+            代理节点列表（按随机种子打乱顺序）
+        """
+        for _ in range(alive):
+            sock = self._listen(128)
+            self._responders.append((sock, functools.partial(self._socks5, delay=0)))
+            self._add('alive', sock.getsockname()[1], 'socks5', 0)
+
+        for _ in range(delayed):
+            delay = self._delay()
+            sock = self._listen(128)
+            self._responders.append((sock, functools.partial(self._socks5, delay=delay)))
+            self._add('delayed', sock.getsockname()[1], 'socks5', delay)
+
+        for _ in range(slow):
+            sock = self._listen(0)
+            self._fill_backlog(sock)
+            thread = threading.Thread(target=self._drain_slowly, args=(sock,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            self._add('slow', sock.getsockname()[1])
+
+        for _ in range(reset):
+            sock = self._listen(128)
+            self._responders.append((sock, self._reset))
+            self._add('reset', sock.getsockname()[1], 'socks5')
+
+        for _ in range(blackhole):
+            sock = self._listen(0)
+            self._fill_backlog(sock)
+            self._add('blackhole', sock.getsockname()[1])
+
+        if slow_tls and self._tls_context() is None:
+            logger.warning("无法生成自签名证书（需要openssl），跳过slow_tls节点")
+        else:
+            for _ in range(slow_tls):
+                delay = self._delay()
+                sock = self._listen(128)
+                self._tls_listeners.append((sock, delay))
+                self._add('slow_tls', sock.getsockname()[1], 'trojan', delay)
+
+        # 真实延迟测试的目标地址
+        sock = self._listen(1024)
+        self.target = sock.getsockname()
+        self._responders.append((sock, self._http_target))
+
+        for _ in range(socks5_proxy):
+            delay, rate = self._delay(), self._bandwidth()
+            sock = self._listen(128)
+            self._responders.append((sock, functools.partial(self._socks5_proxy, delay=delay, rate=rate)))
+            self._add('socks5_proxy', sock.getsockname()[1], 'socks5', delay, rate)
+
+        for _ in range(http_proxy):
+            delay, rate = self._delay(), self._bandwidth()
+            sock = self._listen(128)
+            self._responders.append((sock, functools.partial(self._http_proxy, delay=delay, rate=rate)))
+            self._add('http_proxy', sock.getsockname()[1], 'http', delay, rate)
+
+        if ss_proxy and AESGCM is None:
+            logger.warning("未安装cryptography，跳过ss_proxy节点")
+        else:
+            for i in range(ss_proxy):
+                delay, rate = self._delay(), self._bandwidth()
+                method = SS_METHODS[i % len(SS_METHODS)]
+                sock = self._listen(128)
+                self._responders.append(
+                    (sock, functools.partial(self._ss_proxy, delay=delay, rate=rate, method=method))
+                )
+                self._add('ss_proxy', sock.getsockname()[1], 'ss', delay, rate)
+                self.proxies[-1].update({'cipher': method, 'password': SS_PASSWORD})
+
+        # 最后分配，避免之后创建的监听端口恰好占用这些端口
+        for _ in range(refused):
+            # 绑定后立即关闭，得到一个大概率无人监听的端口
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind((LISTEN_HOST, 0))
+            port = sock.getsockname()[1]
+            sock.close()
+            self._add('refused', port)
+
+        self.random.shuffle(self.proxies)
+        return [proxy.copy() for proxy in self.proxies]
+
+    async def _socks5(self, reader, writer, delay):
+        try:
+            _, methods = await reader.readexactly(2)
+            await reader.readexactly(methods)
+            await asyncio.sleep(delay / 1000)
+            writer.write(b'\x05\x00')
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http_target(self, reader, writer):
+        """/payload?bytes=N 返回N字节数据，其余路径返回204"""
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            parts = urlsplit(request.split(b' ', 2)[1].decode('ascii', 'replace'))
+            if parts.path != '/payload':
+                writer.write(b'HTTP/1.1 204 No Content\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                return
+            size = int(parse_qs(parts.query).get('bytes', ['0'])[0])
+            writer.write(f"HTTP/1.1 200 OK\r\nContent-Length: {size}\r\nConnection: close\r\n\r\n".encode('ascii'))
+            chunk = bytes(PAYLOAD_CHUNK)
+            while size > 0:
+                writer.write(chunk[:size])
+                size -= PAYLOAD_CHUNK
+                await writer.drain()
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _bridge(self, client_recv, client_send, host, port, delay, first=b'', rate=None):
+        """等待delay后连接目标，然后双向转发直到任一方向结束；rate (KB/s) 限制下行速度"""
+        await asyncio.sleep(delay / 1000)
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+
+        async def forward_up():
+            data = first or await client_recv()
+            while data:
+                upstream_writer.write(data)
+                await upstream_writer.drain()
+                data = await client_recv()
+
+        async def forward_down():
+            # 按rate匀速下发：每块数据发送前等到累计字节数对应的时间点
+            read_size = min(65536, rate * 1024 // 20) if rate else 65536
+            started = time.perf_counter()
+            sent = 0
+            while True:
+                data = await upstream_reader.read(read_size)
+                if not data:
+                    break
+                if rate:
+                    wait = started + sent / (rate * 1024) - time.perf_counter()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    sent += len(data)
+                await client_send(data)
+
+        try:
+            up = asyncio.create_task(forward_up())
+            await forward_down()
+            up.cancel()
+        finally:
+            upstream_writer.close()
+
+    async def _socks5_proxy(self, reader, writer, delay, rate):
+        async def send(data):
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            _, methods = await reader.readexactly(2)
+            await reader.readexactly(methods)
+            writer.write(b'\x05\x00')
+            header = await reader.readexactly(4)
+            host, port = await _read_address(reader, header[3])
+            await asyncio.sleep(delay / 1000)
+            writer.write(b'\x05\x00\x00\x01' + bytes(6))
+            await self._bridge(lambda: reader.read(65536), send, host, port, 0, rate=rate)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http_proxy(self, reader, writer, delay, rate):
+        async def send(data):
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            request_line = await reader.readline()
+            await reader.readuntil(b'\r\n\r\n')
+            host, _, port = request_line.split()[1].decode().rpartition(':')
+            await asyncio.sleep(delay / 1000)
+            writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+            await self._bridge(lambda: reader.read(65536), send, host, int(port), 0, rate=rate)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _ss_proxy(self, reader, writer, delay, rate, method):
+        encryptor = ShadowsocksCipher(method, SS_PASSWORD)
+        pending_salt = [encryptor.salt]
+
+        async def recv():
+            try:
+                return await decryptor.read_chunk(reader)
+            except asyncio.IncompleteReadError:
+                return b''
+
+        async def send(data):
+            writer.write(b''.join(pending_salt) + encryptor.encrypt(data))
+            pending_salt.clear()
+            await writer.drain()
+
+        try:
+            salt = await reader.readexactly(ShadowsocksCipher.salt_size(method))
+            decryptor = ShadowsocksCipher(method, SS_PASSWORD, salt)
+            payload = await decryptor.read_chunk(reader)
+            host, port, offset = _parse_address(payload)
+            await self._bridge(recv, send, host, port, delay, payload[offset:], rate)
+        except (OSError, ValueError, ProbeError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _reset(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        writer.transport.abort()
+
+    async def _accept_tls(self, sock, delay):
+        loop = asyncio.get_running_loop()
+        sock.setblocking(False)
+        while True:
+            conn, _ = await loop.sock_accept(sock)
+            task = asyncio.create_task(self._slow_tls(conn, delay))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _slow_tls(self, conn, delay):
+        # 延迟期间ClientHello留在内核缓冲区中，之后才开始TLS握手
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.sleep(delay / 1000)
+            transport, _ = await loop.connect_accepted_socket(asyncio.Protocol, sock=conn, ssl=self._ssl_context)
+            transport.close()
+        except (OSError, ssl.SSLError):
+            conn.close()
+
+    def _tracked(self, handler):
+        """包装连接处理函数：记录在途任务以便停止时取消，并吞掉停止时的取消
+
+        start_server在处理任务结束后调用task.exception()，任务以取消结束时会打印异常栈。
+        """
+        async def wrapper(reader, writer):
+            task = asyncio.current_task()
+            self._tasks.add(task)
+            try:
+                await handler(reader, writer)
+            except asyncio.CancelledError:
+                writer.transport.abort()
+            finally:
+                self._tasks.discard(task)
+        return wrapper
+
+    async def serve(self, conn):
+        """启动所有应答端，通知父进程后一直运行到收到停止消息"""
+        servers = []
+        for sock, handler in self._responders:
+            servers.append(await asyncio.start_server(self._tracked(handler), sock=sock, backlog=128))
+        for sock, delay in self._tls_listeners:
+            self._tasks.add(asyncio.create_task(self._accept_tls(sock, delay)))
+        target_url = f"http://{self.target[0]}:{self.target[1]}/generate_204"
+        conn.send(('ready', [proxy.copy() for proxy in self.proxies], self.truth, target_url))
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, conn.recv)
+        for server in servers:
+            server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        for sock in self.sockets:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        if self._tempdir:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+
+
+def _fleet_main(counts, seed, delay_range, conn):
+    """模拟节点进程入口"""
+    fleet = ListenerFleet(seed, delay_range)
+    try:
+        fleet.start(**counts)
+        asyncio.run(fleet.serve(conn))
+    except EOFError:
+        pass
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        fleet.close()
+
+
+class FleetProcess:
+    """在子进程中运行ListenerFleet，使应答端不占用被测进程的CPU和内存"""
+
+    def __init__(self, counts, seed=0, delay_range=(0, 400)):
+        self.counts = counts
+        self.seed = seed
+        self.delay_range = delay_range
+        self._conn = None
+        self._process = None
+        self.target_url = None
+
+    def start(self):
+        """启动子进程并等待节点就绪
+
+        Returns:
+            (代理节点列表, 节点名 -> {'kind', 'delay', 'rate'})
+        """
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_fleet_main, args=(self.counts, self.seed, self.delay_range, child_conn), daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+        if not self._conn.poll(FLEET_START_TIMEOUT):
+            raise RuntimeError("模拟节点进程启动超时")
+        message = self._conn.recv()
+        if message[0] != 'ready':
+            raise RuntimeError(f"模拟节点进程启动失败: {message[1]}")
+        self.target_url = message[3]
+        return message[1], message[2]
+
+    def payload_url(self, size):
+        """返回size字节测试数据的下载地址"""
+        return f"{self.target_url.rsplit('/', 1)[0]}/payload?bytes={size}"
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send('stop')
+        except OSError:
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+
+def _ranks(values):
+    """平均名次（并列取平均）"""
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def spearman(a, b):
+    """Spearman秩相关系数，样本不足或没有差异时返回None"""
+    if len(a) < 2:
+        return None
+    ra, rb = _ranks(a), _ranks(b)
+    mean_a, mean_b = statistics.mean(ra), statistics.mean(rb)
+    cov = sum((x - mean_a) * (y - mean_b) for x, y in zip(ra, rb))
+    var_a = sum((x - mean_a) ** 2 for x in ra)
+    var_b = sum((y - mean_b) ** 2 for y in rb)
+    if var_a == 0 or var_b == 0:
+        return None
+    return cov / (var_a * var_b) ** 0.5
+
+
+def evaluate(results, truth, timeout_ms, real_delay=False):
+    """将测试结果与真实情况比较，提前结束时未测试的节点不计入
+
+    Args:
+        results: [(proxy, latency)] 列表
+        truth: 节点名 -> {'kind', 'delay', 'rate'}
+        timeout_ms: 测试超时时间（毫秒）
+        real_delay: 是否启用了真实延迟测试
+
+    Returns:
+        统计字典：误判数量、握手/真实延迟排名相关系数和平均绝对误差
+    """
+    expected_valid = EXPECTED_VALID_REAL_DELAY if real_delay else EXPECTED_VALID
+    false_valid = false_invalid = 0
+    measured, expected = [], []
+    for proxy, latency in results:
+        info = truth[proxy['name']]
+        valid = latency >= 0
+        should_be_valid = expected_valid.get(info['kind'])
+        if should_be_valid is not None and info['delay'] is not None and info['delay'] >= timeout_ms:
+            should_be_valid = False
+        if should_be_valid is True and not valid:
+            false_invalid += 1
+        elif should_be_valid is False and valid:
+            false_valid += 1
+
+        value = proxy.get('real_delay', proxy.get('handshake_latency'))
+        if valid and info['delay'] is not None and value is not None:
+            measured.append(value)
+            expected.append(info['delay'])
+
+    return {
+        'false_valid': false_valid,
+        'false_invalid': false_invalid,
+        'ranked': len(measured),
+        'spearman': spearman(measured, expected),
+        'mae': statistics.mean(abs(m - e) for m, e in zip(measured, expected)) if measured else None,
+    }
+
+
+def _resource_snapshot():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def _cpu_seconds(before, after):
+    """两次快照之间本进程及已回收子进程（分片进程）的CPU时间"""
+    total = 0.0
+    for old, new in zip(before, after):
+        total += (new.ru_utime - old.ru_utime) + (new.ru_stime - old.ru_stime)
+    return total
+
+
+async def blocking_baseline(proxies, timeout, concurrent):
+    """旧版实现的近似：在协程中调用阻塞connect，按批次gather"""
+    async def probe(proxy):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect((proxy['server'], proxy['port']))
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    valid = 0
+    for i in range(0, len(proxies), concurrent):
+        results = await asyncio.gather(*(probe(p) for p in proxies[i:i + concurrent]))
+        valid += sum(results)
+    return valid
+
+
+async def run_benchmark(args):
+    counts = {
+        'alive': args.alive,
+        'delayed': args.delayed,
+        'slow': args.slow,
+        'refused': args.refused,
+        'reset': args.reset,
+        'blackhole': args.blackhole,
+        'slow_tls': args.slow_tls,
+        'socks5_proxy': args.socks5_proxy,
+        'http_proxy': args.http_proxy,
+        'ss_proxy': args.ss_proxy,
+    }
+    fleet = FleetProcess(counts, args.seed, (args.min_delay, args.max_delay))
+    proxies, truth = fleet.start()
+    timeout = args.timeout / 1000
+
+    config = {
+        'latency_test': {
+            'timeout': args.timeout,
+            'concurrent_tests': args.concurrent,
+            'retry_count': 1,
+            'max_nodes': len(proxies),
+            'adaptive_concurrency': args.adaptive,
+            'shard_workers': args.workers,
+            'target_count': args.target,
+            'deadline': args.deadline,
+            'backend': args.backend,
+            'shard_threshold': 1,
+            'history': {'enable': bool(args.history), 'file': args.history or ''},
+            'real_delay': {'enable': args.real_delay, 'url': fleet.target_url},
+            'circuit_breaker': {'enable': bool(args.breaker), 'file': args.breaker or ''},
+            # 模拟节点都在本机回环地址上
+            'bogon_filter': {'allow': ['127.0.0.0/8']},
+            'throughput': {
+                'enable': args.throughput,
+                'url': fleet.payload_url(args.payload_kb * 1024),
+                'top_n': args.throughput_top,
+                'max_bytes': args.payload_kb * 1024,
+                'concurrent': args.throughput_concurrent,
+            },
+        }
+    }
+
+    try:
+        summary = ', '.join(f"{kind}={count}" for kind, count in counts.items() if count)
+        print(f"节点总数: {len(proxies)} ({summary}), 并发: {args.concurrent}, 随机种子: {args.seed}")
+
+        for run in range(args.runs):
+            tester = LatencyTester(config)
+            results = []
+            before = _resource_snapshot()
+            start_time = time.perf_counter()
+            async for proxy, latency in tester.stream([proxy.copy() for proxy in proxies]):
+                results.append((proxy, latency))
+            elapsed = time.perf_counter() - start_time
+            after = _resource_snapshot()
+            valid = [proxy for proxy, latency in results if tester.is_valid_latency(latency, proxy)]
+
+            print(f"LatencyTester:   {elapsed:7.2f} 秒, 有效节点 {len(valid)}, "
+                  f"{len(proxies) / elapsed:.1f} 节点/秒")
+            if tester.stop_reason:
+                print(f"  提前结束: {tester.stop_reason}, 跳过 {tester.stats['skipped']} 个节点")
+
+            kernel = [proxy['kernel_rtt'] for proxy in valid if 'kernel_rtt' in proxy]
+            if kernel:
+                userland = [proxy['latency'] for proxy in valid if 'kernel_rtt' in proxy]
+                print(f"  平均延迟: 用户态 {statistics.mean(userland):.2f} ms, "
+                      f"内核RTT {statistics.mean(kernel):.3f} ms")
+
+            result = evaluate(results, truth, args.timeout, args.real_delay)
+            print(f"  误判: 应失效却有效 {result['false_valid']} 个, 应有效却失效 {result['false_invalid']} 个")
+            if result['spearman'] is not None:
+                print(f"  握手/真实延迟排名: Spearman {result['spearman']:.3f} ({result['ranked']} 个节点), "
+                      f"平均绝对误差 {result['mae']:.1f} ms")
+            else:
+                print("  握手/真实延迟排名: 无可比较的延迟数据")
+
+            if args.throughput:
+                valid.sort(key=tester.sort_key)
+                start_time = time.perf_counter()
+                await tester.measure_throughput(valid)
+                throughput_elapsed = time.perf_counter() - start_time
+                measured = [(proxy['throughput'], truth[proxy['name']]['rate']) for proxy in valid
+                            if 'throughput' in proxy and truth[proxy['name']]['rate']]
+                correlation = spearman([m for m, _ in measured], [r for _, r in measured])
+                print(f"  带宽测试: {throughput_elapsed:.2f} 秒, 测得 {len(measured)} 个节点, "
+                      f"Spearman {correlation if correlation is None else f'{correlation:.3f}'}")
+                if measured:
+                    error = statistics.mean(abs(m - r) / r for m, r in measured)
+                    print(f"  带宽平均相对误差: {error:.1%}")
+
+            if before is not None:
+                cpu = _cpu_seconds(before, after)
+                peak_mb = max(after[0].ru_maxrss, after[1].ru_maxrss) / 1024
+                print(f"  CPU: {cpu:.2f} 秒 ({cpu / elapsed:.0%} 墙钟时间), 峰值内存 {peak_mb:.1f} MB")
+
+        if args.baseline:
+            start_time = time.perf_counter()
+            valid_count = await blocking_baseline(proxies, timeout, args.concurrent)
+            elapsed = time.perf_counter() - start_time
+            print(f"阻塞connect基线: {elapsed:7.2f} 秒, 有效节点 {valid_count}")
+    finally:
+        fleet.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='LatencyTester 本地基准测试')
+    parser.add_argument('--alive', type=int, default=200, help='正常节点数量')
+    parser.add_argument('--delayed', type=int, default=100, help='延迟应答节点数量')
+    parser.add_argument('--slow', type=int, default=50, help='慢速节点数量')
+    parser.add_argument('--refused', type=int, default=25, help='拒绝连接的节点数量')
+    parser.add_argument('--reset', type=int, default=25, help='连接后立即RST的节点数量')
+    parser.add_argument('--blackhole', type=int, default=25, help='黑洞节点数量')
+    parser.add_argument('--slow-tls', type=int, default=25, help='慢速TLS节点数量')
+    parser.add_argument('--socks5-proxy', type=int, default=0, help='转发流量的SOCKS5代理数量')
+    parser.add_argument('--http-proxy', type=int, default=0, help='转发流量的HTTP代理数量')
+    parser.add_argument('--ss-proxy', type=int, default=0, help='转发流量的shadowsocks代理数量')
+    parser.add_argument('--real-delay', action='store_true', help='启用真实延迟测试（请求本地测试地址）')
+    parser.add_argument('--throughput', action='store_true', help='延迟测试后对排名靠前的节点做带宽测试')
+    parser.add_argument('--throughput-top', type=int, default=20, help='带宽测试的节点数量')
+    parser.add_argument('--throughput-concurrent', type=int, default=4, help='带宽测试的并发数量')
+    parser.add_argument('--payload-kb', type=int, default=1024, help='带宽测试下载的数据量(KB)')
+    parser.add_argument('--min-delay', type=int, default=0, help='延迟应答/慢速TLS节点的最小延迟(毫秒)')
+    parser.add_argument('--max-delay', type=int, default=400, help='延迟应答/慢速TLS节点的最大延迟(毫秒)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--concurrent', type=int, default=20, help='并发测试数量')
+    parser.add_argument('--timeout', type=int, default=2000, help='超时时间(毫秒)')
+    parser.add_argument('--adaptive', action='store_true', help='启用AIMD自适应并发')
+    parser.add_argument('--backend', default='asyncio', choices=['asyncio', 'epoll'], help='探测后端')
+    parser.add_argument('--target', type=int, default=0, help='Top-K模式的目标节点数，0表示测试全部节点')
+    parser.add_argument('--deadline', type=float, default=0, help='整轮测试的时间上限(秒)，0表示不限制')
+    parser.add_argument('--workers', type=int, default=0, help='分片测试的进程数，0表示单进程')
+    parser.add_argument('--history', default=None, help='延迟历史记录文件，配合--runs观察增量测试效果')
+    parser.add_argument('--breaker', default=None, help='端点熔断记录文件，配合--runs观察跳过失效端点的效果')
+    parser.add_argument('--runs', type=int, default=1, help='连续运行次数')
+    parser.add_argument('--baseline', action='store_true', help='同时运行阻塞connect基线做对比')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_args()))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+订阅解析基准脚本 - 生成带大量rules和proxy-groups的合成订阅文件，
+比较完整解析与只提取proxies的耗时和峰值内存
+每种方式在独立的子进程中运行，峰值内存互不影响
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 允许从scripts目录直接运行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config_parser import SafeLoader, parse_document
+
+CIPHERS = ('aes-128-gcm', 'aes-256-gcm', 'chacha20-ietf-poly1305')
+RULE_TYPES = ('DOMAIN-SUFFIX', 'DOMAIN', 'DOMAIN-KEYWORD', 'IP-CIDR')
+
+
+def generate(path, size_mb, proxy_share, seed):
+    """生成合成订阅文件
+
+    Args:
+        path: 输出文件路径
+        size_mb: 目标大小(MB)
+        proxy_share: proxies部分占文件大小的比例
+        seed: 随机种子
+
+    Returns:
+        (节点数, 规则数)
+    """
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    proxy_target = int(target * proxy_share)
+    written = 0
+    proxies = rules = 0
+
+    with open(path, 'w', encoding='utf-8') as f:
+        def write(line):
+            nonlocal written
+            f.write(line)
+            written += len(line)
+
+        write('port: 7890\nsocks-port: 7891\nallow-lan: true\nmode: rule\nlog-level: info\n')
+        write('proxies:\n')
+        while written < proxy_target:
+            index = proxies
+            if index % 2:
+                write(f"  - {{name: node-{index}, type: ss, server: s{index}.example.com, "
+                      f"port: {rng.randint(1000, 65000)}, cipher: {rng.choice(CIPHERS)}, "
+                      f"password: {rng.getrandbits(64):016x}, udp: true}}\n")
+            else:
+                write(f"  - name: node-{index}\n    type: vmess\n    server: v{index}.example.net\n"
+                      f"    port: {rng.randint(1000, 65000)}\n    uuid: {rng.getrandbits(128):032x}\n"
+                      f"    alterId: 0\n    cipher: auto\n    tls: true\n")
+            proxies += 1
+
+        # proxy-groups引用大量节点名，rules占据剩余大小
+        write('proxy-groups:\n')
+        for group in range(20):
+            write(f"  - name: group-{group}\n    type: select\n    proxies:\n")
+            for index in range(0, proxies, max(1, proxies // 2000)):
+                write(f"      - node-{index}\n")
+        write('rules:\n')
+        while written < target:
+            write(f"  - {rng.choice(RULE_TYPES)},d{rules}.example.org,group-{rng.randrange(20)}\n")
+            rules += 1
+        write('  - MATCH,DIRECT\n')
+    return proxies, rules
+
+
+def _measure(path, proxies_only, conn):
+    """子进程入口：解析文件并回报耗时、节点数和峰值内存"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    start = time.perf_counter()
+    config = parse_document(content, proxies_only)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    conn.send((elapsed, len(config.get('proxies') or []), baseline, peak))
+
+
+def run(path, proxies_only):
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=_measure, args=(path, proxies_only, child_conn))
+    process.start()
+    child_conn.close()
+    result = parent_conn.recv()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订阅解析基准测试')
+    parser.add_argument('--size-mb', type=int, default=50, help='合成订阅文件大小(MB)')
+    parser.add_argument('--proxy-share', type=float, default=0.2, help='proxies部分占文件大小的比例')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--runs', type=int, default=1, help='每种方式的运行次数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='yaml-bench-') as tempdir:
+        path = os.path.join(tempdir, 'subscription.yaml')
+        proxies, rules = generate(path, args.size_mb, args.proxy_share, args.seed)
+        size = os.path.getsize(path) / 1024 / 1024
+        print(f"合成订阅: {size:.1f} MB, {proxies} 个节点, {rules} 条规则, 加载器: {SafeLoader.__name__}")
+
+        results = {}
+        for label, proxies_only in (('完整解析', False), ('只提取proxies', True)):
+            for _ in range(args.runs):
+                elapsed, count, baseline, peak = run(path, proxies_only)
+                best = results.get(label)
+                if best is None or elapsed < best[0]:
+                    results[label] = (elapsed, count, baseline, peak)
+            elapsed, count, baseline, peak = results[label]
+            line = f"{label:<12} {elapsed:7.2f} 秒, {count} 个有效节点"
+            if peak is not None:
+                line += f", 峰值内存 {peak / 1024:.0f} MB (解析前 {baseline / 1024:.0f} MB)"
+            print(line)
+
+        full, partial = results['完整解析'], results['只提取proxies']
+        print(f"耗时降低 {1 - partial[0] / full[0]:.0%}", end='')
+        if full[3] is not None:
+            print(f", 解析增加的内存降低 {1 - (partial[3] - partial[2]) / max(1, full[3] - full[2]):.0%}")
+        else:
+            print()
+
+
+if __name__ == "__main__":
+    main()
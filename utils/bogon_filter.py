@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+保留地址过滤 - 用预编译的前缀表识别回环、私有、文档、组播等不可能作为公网节点的地址
+"""
+
+import socket
+import logging
+import ipaddress
+
+logger = logging.getLogger(__name__)
+
+# 不可能是公网代理节点的地址段（IANA特殊用途地址）
+BOGON_PREFIXES = (
+    '0.0.0.0/8',          # 本网络
+    '10.0.0.0/8',         # 私有地址
+    '100.64.0.0/10',      # 运营商级NAT
+    '127.0.0.0/8',        # 回环
+    '169.254.0.0/16',     # 链路本地
+    '172.16.0.0/12',      # 私有地址
+    '192.0.0.0/24',       # IETF协议分配
+    '192.0.2.0/24',       # 文档 TEST-NET-1
+    '192.88.99.0/24',     # 已废弃的6to4中继
+    '192.168.0.0/16',     # 私有地址
+    '198.18.0.0/15',      # 网络性能测试（也是Clash fake-ip默认网段）
+    '198.51.100.0/24',    # 文档 TEST-NET-2
+    '203.0.113.0/24',     # 文档 TEST-NET-3
+    '224.0.0.0/4',        # 组播
+    '240.0.0.0/4',        # 保留及广播
+    '::/128',             # 未指定地址
+    '::1/128',            # 回环
+    '64:ff9b:1::/48',     # 本地NAT64
+    '100::/64',           # 丢弃前缀
+    '2001:db8::/32',      # 文档
+    'fc00::/7',           # 唯一本地地址
+    'fe80::/10',          # 链路本地
+    'ff00::/8',           # 组播
+)
+
+class BogonFilter:
+    """按前缀表判断地址是否为保留地址
+
+    前缀按长度分组编译为 {前缀长度: 网络号集合}，判断一个地址只需对每种前缀长度做一次移位和集合查找，
+    不依赖ipaddress对象，10万节点级别的过滤耗时可忽略。
+    """
+
+    def __init__(self, extra_prefixes=(), allow_prefixes=()):
+        """初始化过滤器
+
+        Args:
+            extra_prefixes: 额外屏蔽的地址段（CIDR字符串）
+            allow_prefixes: 不屏蔽的地址段，优先于屏蔽规则（如本地测试时放行127.0.0.0/8）
+        """
+        self._blocked = self._compile(tuple(BOGON_PREFIXES) + tuple(extra_prefixes or ()))
+        self._allowed = self._compile(allow_prefixes or ())
+
+    @staticmethod
+    def _compile(prefixes):
+        """把CIDR列表编译为 {地址族: [(前缀长度, 移位位数, 网络号集合)]}"""
+        tables = {socket.AF_INET: {}, socket.AF_INET6: {}}
+        for prefix in prefixes:
+            try:
+                network = ipaddress.ip_network(str(prefix).strip(), strict=False)
+            except ValueError:
+                logger.warning(f"忽略无效的地址段: {prefix}")
+                continue
+            family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+            shift = network.max_prefixlen - network.prefixlen
+            tables[family].setdefault(network.prefixlen, (shift, set()))[1].add(
+                int(network.network_address) >> shift
+            )
+        return {family: [(length, shift, networks) for length, (shift, networks) in sorted(table.items())]
+                for family, table in tables.items()}
+
+    @staticmethod
+    def _parse(address):
+        """解析IP地址字面量，返回 (地址族, 整数值)；不是IP地址时返回None"""
+        if isinstance(address, str) and '%' in address:
+            # 带作用域的IPv6地址（fe80::1%eth0）
+            address = address.split('%', 1)[0]
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                packed = socket.inet_pton(family, address)
+            except (OSError, ValueError, TypeError):
+                continue
+            value = int.from_bytes(packed, 'big')
+            # IPv4映射的IPv6地址（::ffff:a.b.c.d）按IPv4规则判断
+            if family == socket.AF_INET6 and value >> 32 == 0xffff:
+                return socket.AF_INET, value & 0xffffffff
+            return family, value
+        return None
+
+    @staticmethod
+    def _match(table, value):
+        for _, shift, networks in table:
+            if value >> shift in networks:
+                return True
+        return False
+
+    def is_bogon(self, address):
+        """地址是否属于保留地址段
+
+        Args:
+            address: IP地址字符串；域名等非IP地址返回False
+
+        Returns:
+            是否为保留地址
+        """
+        parsed = self._parse(address)
+        if parsed is None:
+            return False
+        family, value = parsed
+        if self._match(self._allowed[family], value):
+            return False
+        return self._match(self._blocked[family], value)
+
+    def split(self, proxies):
+        """按服务器地址把节点分为可测试和保留地址两组
+
+        Args:
+            proxies: 代理节点列表
+
+        Returns:
+            (可测试的节点列表, 服务器地址为保留地址的节点列表)
+        """
+        kept = []
+        rejected = []
+        for proxy in proxies:
+            server = proxy.get('server')
+            if isinstance(server, str) and self.is_bogon(server.strip()):
+                rejected.append(proxy)
+            else:
+                kept.append(proxy)
+        return kept, rejected
+
+    def filter_addrinfo(self, addrinfo):
+        """去掉getaddrinfo结果中的保留地址"""
+        return [info for info in addrinfo if not self.is_bogon(info[4][0])]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+端点熔断器 - 持久化记录连续测试失败的端点，在指数增长的退避时间内不再测试，并以小概率放行做重新检测
+"""
+
+import os
+import time
+import random
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EndpointBreaker:
+    """按端点（服务器+端口）记录连续失败次数的熔断器
+
+    - 连续失败达到failure_threshold次后熔断，熔断时长为
+      base_backoff * 2^(失败次数 - failure_threshold)，不超过max_backoff
+    - 熔断期间的端点以readmit_rate的概率被放行测试；成功则立即恢复，失败则继续延长熔断
+    """
+
+    def __init__(self, path, failure_threshold=3, base_backoff=3600, max_backoff=7 * 24 * 3600,
+                 readmit_rate=0.05):
+        """初始化熔断器
+
+        Args:
+            path: SQLite数据库文件路径（可与延迟历史记录共用）
+            failure_threshold: 连续失败多少次后熔断
+            base_backoff: 第一次熔断的时长（秒）
+            max_backoff: 熔断时长上限（秒）
+            readmit_rate: 熔断期间端点被放行测试的概率
+        """
+        self.path = path
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.readmit_rate = readmit_rate
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS endpoint_failures ('
+            ' endpoint TEXT PRIMARY KEY,'
+            ' failures INTEGER NOT NULL,'
+            ' open_until REAL NOT NULL,'
+            ' last_failure REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def endpoint_key(proxy):
+        """节点所在端点的标识"""
+        return f"{str(proxy.get('server', '')).strip().lower()}:{proxy.get('port')}"
+
+    def _load(self, endpoints):
+        """批量读取端点的 (连续失败次数, 熔断截止时间)"""
+        records = {}
+        endpoints = list(endpoints)
+        for i in range(0, len(endpoints), 500):
+            chunk = endpoints[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                f'SELECT endpoint, failures, open_until FROM endpoint_failures WHERE endpoint IN ({placeholders})',
+                chunk
+            )
+            for endpoint, failures, open_until in rows:
+                records[endpoint] = (failures, open_until)
+        return records
+
+    def admit(self, proxies):
+        """过滤掉处于熔断期的端点上的节点
+
+        Args:
+            proxies: 代理节点列表
+
+        Returns:
+            (放行的节点列表, 被熔断跳过的节点数, 熔断中被概率放行的端点数)
+        """
+        now = time.time()
+        records = self._load({self.endpoint_key(proxy) for proxy in proxies})
+
+        decisions = {}
+        admitted = []
+        blocked = 0
+        readmitted = 0
+        for proxy in proxies:
+            endpoint = self.endpoint_key(proxy)
+            if endpoint not in decisions:
+                record = records.get(endpoint)
+                if record is None or record[1] <= now:
+                    decisions[endpoint] = True
+                else:
+                    # 同一端点上的节点共用一次放行判定
+                    decisions[endpoint] = random.random() < self.readmit_rate
+                    readmitted += decisions[endpoint]
+            if decisions[endpoint]:
+                admitted.append(proxy)
+            else:
+                blocked += 1
+        return admitted, blocked, readmitted
+
+    def record(self, results):
+        """写入一批测试结果：端点有任一节点成功即恢复，否则连续失败次数加一
+
+        Args:
+            results: [(proxy, latency)] 列表，latency为-1表示失败
+        """
+        outcomes = {}
+        for proxy, latency in results:
+            endpoint = self.endpoint_key(proxy)
+            outcomes[endpoint] = outcomes.get(endpoint, False) or latency >= 0
+        if not outcomes:
+            return
+
+        now = time.time()
+        failed = [endpoint for endpoint, ok in outcomes.items() if not ok]
+        existing = self._load(failed)
+
+        rows = []
+        for endpoint in failed:
+            failures = existing.get(endpoint, (0, 0))[0] + 1
+            open_until = 0
+            if failures >= self.failure_threshold:
+                backoff = self.base_backoff * 2 ** (failures - self.failure_threshold)
+                open_until = now + min(self.max_backoff, backoff)
+            rows.append((endpoint, failures, open_until, now))
+
+        with self._conn:
+            self._conn.executemany(
+                'DELETE FROM endpoint_failures WHERE endpoint = ?',
+                [(endpoint,) for endpoint, ok in outcomes.items() if ok]
+            )
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO endpoint_failures (endpoint, failures, open_until, last_failure) '
+                'VALUES (?, ?, ?, ?)', rows
+            )
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
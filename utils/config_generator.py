@@ -61,10 +61,11 @@ class ConfigGenerator:
         if self.output_config.get('backup', True) and os.path.exists(output_file):
             self._create_backup(output_file)
         
-        # 复制模板配置
-        new_config = template_config.copy()
+        # 复制模板配置，移除下划线开头的内部字段
+        new_config = {k: v for k, v in template_config.items() if not str(k).startswith('_')}
         
         # 更新代理节点
+        proxies = [{k: v for k, v in proxy.items() if not str(k).startswith('_')} for proxy in proxies]
         new_config['proxies'] = proxies
         
         # 如果有代理组，更新代理组中的代理列表
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+配置解析器 - 在进程池中解析订阅YAML（有libyaml时使用CSafeLoader），下载与解析之间用有界队列衔接；
+不作为模板的订阅只从事件流中提取proxies部分，跳过rules等其他字段
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from utils.proxy_merger import ProxyMerger
+
+logger = logging.getLogger(__name__)
+
+# libyaml的C实现比纯Python的SafeLoader快一个数量级，安全性相同
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 流式提取时保留的顶层字段：proxies完整构造，其余两个只记录存在（用于判断是否为Clash配置）
+_KEEP_KEY = 'proxies'
+_MARK_KEYS = ('proxy-providers', 'proxy-groups')
+
+# 解析进程内复用的校验器
+_validator = None
+
+def is_clash_config(config):
+    """是否包含Clash配置的必要字段"""
+    return (isinstance(config, dict) and
+            ('proxies' in config or 'proxy-providers' in config or 'proxy-groups' in config))
+
+def _skip_node(loader):
+    """消费一个节点的全部事件，不构造任何对象
+
+    Returns:
+        节点在文本中的结束位置
+    """
+    get_event = loader.get_event
+    depth = 0
+    while True:
+        event = get_event()
+        kind = event.__class__
+        if kind is yaml.MappingStartEvent or kind is yaml.SequenceStartEvent:
+            depth += 1
+        elif kind is yaml.MappingEndEvent or kind is yaml.SequenceEndEvent:
+            depth -= 1
+        if depth == 0:
+            return event.end_mark.index
+
+def extract_proxies(content):
+    """只构造顶层proxies字段，其他字段的事件直接跳过
+
+    扫描顶层映射的事件流找到proxies值在文本中的范围，只把这一段交给加载器构造对象；
+    其余字段只产生事件，不组装节点。proxy-providers和proxy-groups只记录存在（值为None）；
+    结果带_partial标记，不能作为输出模板。
+    顶层不是映射，或按范围截取的proxies无法单独解析（如引用了其他部分中定义的锚点）时，退回完整解析。
+
+    Args:
+        content: YAML文本
+
+    Returns:
+        解析结果
+    """
+    # libyaml跳过开头的BOM但不计入位置，不去掉会使截取的范围错开一个字符
+    if content.startswith('\ufeff'):
+        content = content[1:]
+    loader = SafeLoader(content)
+    try:
+        loader.get_event()  # StreamStart
+        if loader.check_event(yaml.StreamEndEvent):
+            return None
+        loader.get_event()  # DocumentStart
+        if not loader.check_event(yaml.MappingStartEvent):
+            return yaml.load(content, Loader=SafeLoader)
+        loader.get_event()
+
+        config = {'_partial': True}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.peek_event()
+            key = key.value if isinstance(key, yaml.ScalarEvent) else None
+            _skip_node(loader)
+            if key == _KEEP_KEY:
+                # 按原缩进还原为单独的文档，由加载器（libyaml）整体解析
+                start = loader.peek_event().start_mark
+                end = _skip_node(loader)
+                text = f"{_KEEP_KEY}:\n{' ' * start.column}{content[start.index:end]}"
+                config[key] = yaml.load(text, Loader=SafeLoader)[_KEEP_KEY]
+            else:
+                if key in _MARK_KEYS:
+                    config[key] = None
+                _skip_node(loader)
+        return config
+    except yaml.YAMLError:
+        # 锚点定义在proxies之外等情况；内容本身不合法时由完整解析抛出异常
+        return yaml.load(content, Loader=SafeLoader)
+    finally:
+        loader.dispose()
+
+def parse_document(content, proxies_only=False):
+    """解析订阅内容并校验其中的代理节点
+
+    可在解析进程中运行。Clash配置中的proxies只保留有效节点，被过滤的节点数记录在_invalid字段，
+    合并时不再重复校验。
+
+    Args:
+        content: YAML文本
+        proxies_only: 只提取proxies字段（用于不作为输出模板的订阅）
+
+    Returns:
+        解析结果
+
+    Raises:
+        yaml.YAMLError: 内容不是合法的YAML
+    """
+    global _validator
+    if proxies_only:
+        config = extract_proxies(content)
+    else:
+        config = yaml.load(content, Loader=SafeLoader)
+    if is_clash_config(config):
+        proxies = config.get('proxies')
+        if isinstance(proxies, list):
+            if _validator is None:
+                _validator = ProxyMerger()
+            config['proxies'], config['_invalid'] = _validator.validate_proxies(proxies)
+    return config
+
+class ParsePipeline:
+    """下载协程把内容放入有界队列，解析协程从队列取出并交给进程池解析
+
+    队列满时下载协程在parse()中等待，已下载但未解析的内容不会无限堆积；
+    小于min_bytes的内容直接在当前进程解析，避免进程间传输的开销。
+
+    用法:
+        async with ParsePipeline(workers) as pipeline:
+            config = await pipeline.parse(content)
+    """
+
+    def __init__(self, workers=None, queue_size=4, min_bytes=256 * 1024):
+        """初始化解析流水线
+
+        Args:
+            workers: 解析进程数，None表示CPU核数
+            queue_size: 等待解析的文档数上限
+            min_bytes: 达到该长度的内容才交给进程池解析
+        """
+        self.workers = max(1, workers or multiprocessing.cpu_count())
+        self.queue_size = max(1, queue_size)
+        self.min_bytes = min_bytes
+        self._queue = None
+        self._consumers = []
+        self._executor = None
+
+    async def __aenter__(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        if self._executor is not None:
+            # 排队中的解析任务已随解析协程的取消而取消；不等待正在进行的解析，由其在后台结束
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_executor(self):
+        # 第一次遇到大文档时才启动进程池
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def parse(self, content, proxies_only=False):
+        """解析订阅内容，结果与parse_document相同
+
+        Args:
+            content: YAML文本
+            proxies_only: 只提取proxies字段
+
+        Returns:
+            解析结果
+        """
+        if len(content) < self.min_bytes or self._queue is None:
+            return parse_document(content, proxies_only)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((content, proxies_only, future))
+        return await future
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            content, proxies_only, future = await self._queue.get()
+            try:
+                if future.done():
+                    continue
+                result = await loop.run_in_executor(self._get_executor(), parse_document, content, proxies_only)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+DNS解析器 - 为延迟测试提供带缓存的异步域名解析
+"""
+
+import logging
+import asyncio
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class DNSResolver:
+    """异步DNS解析器
+
+    - 解析在独立线程池中进行，不阻塞事件循环
+    - 同一域名的并发解析合并为一次
+    - 成功结果按TTL缓存，解析失败按较短的TTL做负缓存
+    - 可选地去掉解析结果中的保留地址（域名解析到127.0.0.1、私有地址等）
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, workers=16, bogon_filter=None):
+        """初始化解析器
+
+        Args:
+            ttl: 成功结果的缓存时间（秒）
+            negative_ttl: 解析失败的缓存时间（秒）
+            workers: 解析线程数
+            bogon_filter: 可选的BogonFilter，解析结果中的保留地址会被去掉
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.bogon_filter = bogon_filter
+        self._cache = {}     # host -> (expires_at, addrinfo 或 异常)
+        self._inflight = {}  # host -> 进行中的解析任务
+        self._executor = None
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'failures': 0, 'bogon': 0}
+
+    async def resolve(self, host, port):
+        """解析主机地址
+
+        Args:
+            host: 域名或IP地址
+            port: 端口
+
+        Returns:
+            getaddrinfo格式的地址列表，端口已替换为port
+
+        Raises:
+            socket.gaierror: 域名无法解析，或只解析到保留地址
+        """
+        addrinfo = self._numeric(host)
+        if addrinfo is None:
+            addrinfo = await self._lookup(host)
+            if self.bogon_filter is not None:
+                addrinfo = self.bogon_filter.filter_addrinfo(addrinfo)
+                if not addrinfo:
+                    self.stats['bogon'] += 1
+                    raise socket.gaierror(f"{host} 只解析到保留地址")
+        return [(family, socktype, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:]))
+                for family, socktype, proto, canonname, sockaddr in addrinfo]
+
+    def _numeric(self, host):
+        """IP地址字面量直接构造结果，无需解析"""
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                socket.inet_pton(family, host)
+            except (OSError, ValueError):
+                continue
+            sockaddr = (host, 0) if family == socket.AF_INET else (host, 0, 0, 0)
+            return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr)]
+        return None
+
+    async def _lookup(self, host):
+        now = time.monotonic()
+        cached = self._cache.get(host)
+        if cached and cached[0] > now:
+            self.stats['hits'] += 1
+            if isinstance(cached[1], Exception):
+                raise cached[1]
+            return cached[1]
+
+        # 同一主机的并发解析共用一个任务；任务不属于任何调用者，某个调用者被取消不影响其他等待者
+        task = self._inflight.get(host)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['misses'] += 1
+            task = asyncio.ensure_future(self._resolve_and_cache(host))
+            self._inflight[host] = task
+            # 避免所有调用者都被取消时出现 "exception was never retrieved" 警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _resolve_and_cache(self, host):
+        loop = asyncio.get_running_loop()
+        try:
+            addrinfo = await loop.run_in_executor(self._get_executor(), self._getaddrinfo, host)
+        except socket.gaierror as e:
+            self.stats['failures'] += 1
+            self._cache[host] = (time.monotonic() + self.negative_ttl, e)
+            raise
+        except Exception as e:
+            # 主机名无法编码、线程池已关闭等，不缓存
+            self.stats['failures'] += 1
+            raise socket.gaierror(str(e)) from e
+        else:
+            self._cache[host] = (time.monotonic() + self.ttl, addrinfo)
+            return addrinfo
+        finally:
+            self._inflight.pop(host, None)
+
+    @staticmethod
+    def _getaddrinfo(host):
+        return socket.getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dns')
+        return self._executor
+
+    def close(self):
+        """关闭解析线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+epoll探测后端 - 在单独线程中用selectors/epoll循环驱动大量非阻塞TCP连接，用于超大规模节点的连通性测试
+"""
+
+import time
+import heapq
+import errno
+import socket
+import struct
+import logging
+import selectors
+import threading
+
+from utils.tcp_info import kernel_rtt
+
+logger = logging.getLogger(__name__)
+
+# 为日志、DNS线程、数据库等保留的文件描述符数量
+FD_RESERVE = 256
+
+# SO_LINGER(开启, 0秒)：close时直接发送RST，不进入TIME_WAIT
+LINGER_ABORT = struct.pack('ii', 1, 0)
+
+# 探测结果分类（与LatencyTester一致）
+OUTCOME_OK = 'ok'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_REFUSED = 'refused'
+OUTCOME_ERROR = 'error'
+
+def raise_fd_limit():
+    """尽量把RLIMIT_NOFILE软限制提高到硬限制
+
+    Returns:
+        当前软限制；不支持resource模块的平台返回None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        target = hard if hard != resource.RLIM_INFINITY else max(soft, 65536)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+def ephemeral_port_count():
+    """本地临时端口范围大小，读取失败时返回None"""
+    try:
+        with open('/proc/sys/net/ipv4/ip_local_port_range', 'r') as f:
+            low, high = (int(value) for value in f.read().split())
+        return high - low + 1
+    except (OSError, ValueError):
+        return None
+
+def in_flight_budget(limit=None):
+    """根据文件描述符限制和临时端口数量计算在途连接上限
+
+    Args:
+        limit: 配置的上限，None表示不限制
+
+    Returns:
+        在途连接上限
+    """
+    budget = limit or 1 << 20
+    fd_limit = raise_fd_limit()
+    if fd_limit is not None:
+        budget = min(budget, max(1, fd_limit - FD_RESERVE))
+    ports = ephemeral_port_count()
+    if ports:
+        budget = min(budget, int(ports * 0.8))
+    return budget
+
+class _Target:
+    """单个节点的探测状态"""
+
+    __slots__ = ('token', 'addresses', 'address_index', 'winner', 'samples',
+                 'kernel_samples', 'failures', 'attempts', 'outcome')
+
+    def __init__(self, token, addresses):
+        self.token = token
+        self.addresses = addresses
+        self.address_index = 0
+        self.winner = None
+        self.samples = []
+        self.kernel_samples = []
+        self.failures = 0
+        self.attempts = 0
+        self.outcome = OUTCOME_ERROR
+
+class EpollProber:
+    """基于selectors的TCP连接探测器
+
+    每个节点按地址顺序尝试连接（一个地址失败立即尝试下一个），成功后后续采样只连接成功的地址。
+    采样次数和提前放弃规则与LatencyTester一致。所有探测socket在结束时以SO_LINGER 0关闭。
+    """
+
+    def __init__(self, timeout, samples=1, retry_count=1, sample_interval=0.0, max_in_flight=None):
+        """初始化探测器
+
+        Args:
+            timeout: 单次连接超时时间（秒）
+            samples: 每个节点的采样次数
+            retry_count: 前多少次尝试全部失败后放弃
+            sample_interval: 两次采样之间的间隔（秒）
+            max_in_flight: 在途连接上限，None表示根据fd限制自动计算
+        """
+        self.timeout = timeout
+        self.samples = max(1, samples)
+        self.retry_count = max(1, retry_count)
+        self.sample_interval = sample_interval
+        self.max_in_flight = in_flight_budget(max_in_flight)
+        self._stop = threading.Event()
+
+    def stop(self):
+        """请求停止探测，在途连接会被立即中止"""
+        self._stop.set()
+
+    def _finished(self, target):
+        if not target.samples and target.failures >= self.retry_count:
+            return True
+        if target.samples and target.attempts >= self.samples:
+            return True
+        return target.attempts >= max(self.samples, self.retry_count)
+
+    def run(self, targets, on_result):
+        """执行探测，阻塞直到全部完成或被停止
+
+        Args:
+            targets: [(token, [(family, sockaddr), ...])] 列表
+            on_result: 回调 on_result(token, samples_ms, attempts, outcome, family, kernel_samples)，
+                在探测线程中调用；kernel_samples为内核测得的 (rtt, rttvar) 列表
+        """
+        selector_class = getattr(selectors, 'EpollSelector', selectors.DefaultSelector)
+        selector = selector_class()
+        queue = [_Target(token, addresses) for token, addresses in reversed(targets)]
+        ready = []       # (可开始时间, 序号, target)，采样间隔未到的节点
+        deadlines = []   # (超时时间, fd, start_ns)
+        in_flight = {}   # fd -> (sock, target, (family, sockaddr), start_ns)
+        sequence = 0
+
+        def finish(target):
+            family = target.winner[0] if target.winner else None
+            outcome = OUTCOME_OK if target.samples else target.outcome
+            on_result(target.token, target.samples, target.attempts, outcome, family, target.kernel_samples)
+
+        def close(sock):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_ABORT)
+            except OSError:
+                pass
+            sock.close()
+
+        def settle(target, error, latency=None, rtt=None):
+            """记录一次连接结果，并决定下一步"""
+            nonlocal sequence
+            if error is None:
+                target.samples.append(latency)
+                if rtt is not None:
+                    target.kernel_samples.append(rtt)
+                target.attempts += 1
+            elif target.winner is None and target.address_index + 1 < len(target.addresses):
+                # 换下一个地址，不计入尝试次数
+                target.address_index += 1
+                queue.append(target)
+                return
+            else:
+                target.attempts += 1
+                target.failures += 1
+                target.address_index = 0
+                if isinstance(error, socket.timeout):
+                    target.outcome = OUTCOME_TIMEOUT
+                elif error == errno.ECONNREFUSED:
+                    target.outcome = OUTCOME_REFUSED
+                else:
+                    target.outcome = OUTCOME_ERROR
+
+            if self._finished(target):
+                finish(target)
+            else:
+                sequence += 1
+                heapq.heappush(ready, (time.monotonic() + self.sample_interval, sequence, target))
+
+        def start(target):
+            family, sockaddr = target.winner or target.addresses[target.address_index]
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+            except OSError as e:
+                settle(target, e.errno)
+                return
+            sock.setblocking(False)
+            start_ns = time.perf_counter_ns()
+            code = sock.connect_ex(sockaddr)
+            if code == 0:
+                latency = (time.perf_counter_ns() - start_ns) / 1_000_000
+                if target.winner is None:
+                    target.winner = (family, sockaddr)
+                rtt = kernel_rtt(sock)
+                close(sock)
+                settle(target, None, latency, rtt)
+            elif code in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                fd = sock.fileno()
+                selector.register(fd, selectors.EVENT_WRITE)
+                in_flight[fd] = (sock, target, (family, sockaddr), start_ns)
+                heapq.heappush(deadlines, (time.monotonic() + self.timeout, fd, start_ns))
+            else:
+                close(sock)
+                settle(target, code)
+
+        try:
+            while (queue or ready or in_flight) and not self._stop.is_set():
+                now = time.monotonic()
+                while ready and ready[0][0] <= now:
+                    queue.append(heapq.heappop(ready)[2])
+                while queue and len(in_flight) < self.max_in_flight:
+                    start(queue.pop())
+
+                # 等待到下一个超时或下一个采样时间
+                wait = 0.2
+                if deadlines:
+                    wait = min(wait, max(0.0, deadlines[0][0] - now))
+                if ready:
+                    wait = min(wait, max(0.0, ready[0][0] - now))
+                if in_flight:
+                    events = selector.select(wait)
+                else:
+                    # 只剩等待采样间隔的节点
+                    time.sleep(wait)
+                    events = []
+
+                for key, _ in events:
+                    fd = key.fd
+                    sock, target, address, start_ns = in_flight.pop(fd)
+                    latency = (time.perf_counter_ns() - start_ns) / 1_000_000
+                    selector.unregister(fd)
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    rtt = kernel_rtt(sock) if code == 0 else None
+                    close(sock)
+                    if code == 0:
+                        if target.winner is None:
+                            target.winner = address
+                        settle(target, None, latency, rtt)
+                    else:
+                        settle(target, code)
+
+                now = time.monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    _, fd, start_ns = heapq.heappop(deadlines)
+                    entry = in_flight.get(fd)
+                    # fd可能已被复用，用开始时间确认是同一次连接
+                    if entry is None or entry[3] != start_ns:
+                        continue
+                    del in_flight[fd]
+                    selector.unregister(fd)
+                    close(entry[0])
+                    settle(entry[1], socket.timeout())
+        finally:
+            for fd, (sock, _, _, _) in in_flight.items():
+                selector.unregister(fd)
+                close(sock)
+            selector.close()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+抓取策略 - 订阅下载的重试退避、按主机的并发与速率限制
+"""
+
+import time
+import random
+import asyncio
+import logging
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# 值得重试的HTTP状态码：限流和服务端临时错误
+RETRYABLE_STATUS = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+class FetchError(Exception):
+    """一次下载最终失败
+
+    Attributes:
+        status: HTTP状态码；网络错误或超时为None
+        retryable: 是否值得重试（或换镜像再试）
+    """
+
+    def __init__(self, message, status=None, retryable=True):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+def backoff_delay(attempt, base, cap, rng=random):
+    """带完全抖动的指数退避时间
+
+    Args:
+        attempt: 第几次重试（从0开始）
+        base: 第一次重试的退避上限（秒）
+        cap: 退避上限（秒）
+        rng: 随机数生成器
+
+    Returns:
+        等待时间（秒），在 [0, min(cap, base * 2^attempt)] 内均匀分布
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+class TokenBucket:
+    """令牌桶：平均每秒rate个请求，最多连续burst个"""
+
+    def __init__(self, rate, burst):
+        """初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取一个令牌，不足时等待补充"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HostLimiter:
+    """按主机限制同时进行的请求数和请求速率"""
+
+    def __init__(self, concurrency=4, rate=None, burst=None):
+        """初始化限制器
+
+        Args:
+            concurrency: 每个主机同时进行的请求数上限
+            rate: 每个主机每秒请求数上限，None或0表示不限制
+            burst: 令牌桶容量，默认与concurrency相同
+        """
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.burst = burst or self.concurrency
+        self._hosts = {}  # host -> (Semaphore, TokenBucket 或 None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, host):
+        """占用一个主机的请求名额
+
+        用法: async with limiter.slot(host): ...
+        """
+        entry = self._hosts.get(host)
+        if entry is None:
+            bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+            entry = self._hosts[host] = (asyncio.Semaphore(self.concurrency), bucket)
+        semaphore, bucket = entry
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            yield
@@ -8,11 +8,16 @@
 import logging
 import aiohttp
 import asyncio
-import yaml
 import os
+from urllib.parse import urlsplit
 from rich.progress import Progress
 from rich.console import Console
 
+from utils.http_cache import HTTPCache
+from utils.parse_cache import ParsedConfigCache
+from utils.config_parser import ParsePipeline, is_clash_config, parse_document
+from utils.fetch_policy import FetchError, HostLimiter, RETRYABLE_STATUS, backoff_delay
+
 logger = logging.getLogger(__name__)
 console = Console()
 
@@ -37,13 +42,113 @@ class GitHubFetcher:
             self.proxy = proxy_config.get('address')
             logger.info(f"使用HTTP代理: {self.proxy}")
             console.print(f"[yellow]使用HTTP代理: {self.proxy}[/yellow]")
+        
+        # HTTP缓存：用ETag/Last-Modified做条件请求，未变化的文件不重复下载
+        cache_config = config.get('http_cache', {}) or {}
+        self.cache = None
+        if cache_config.get('enable', True):
+            try:
+                self.cache = HTTPCache(cache_config.get('dir', 'cache/http'))
+            except OSError as e:
+                logger.warning(f"无法创建HTTP缓存目录，将完整下载所有文件: {str(e)}")
+        
+        # 解析缓存：内容未变化的订阅直接读取上次解析并校验过的结果
+        parse_cache_config = config.get('parse_cache', {}) or {}
+        self.parse_cache = None
+        if parse_cache_config.get('enable', True):
+            try:
+                self.parse_cache = ParsedConfigCache(
+                    parse_cache_config.get('dir', 'cache/parsed'),
+                    max_age=parse_cache_config.get('max_age', 7 * 24 * 3600)
+                )
+            except OSError as e:
+                logger.warning(f"无法创建解析缓存目录，将解析所有文件: {str(e)}")
+        
+        # 下载策略：重试退避、对冲请求（超过阈值同时请求镜像）、按主机的并发和速率限制
+        fetch_config = config.get('fetch', {}) or {}
+        self.retries = max(0, fetch_config.get('retries', 3))
+        self.backoff_base = fetch_config.get('backoff_base', 0.5)
+        self.backoff_max = fetch_config.get('backoff_max', 8)
+        self.hedge_delay = fetch_config.get('hedge_delay', 3)
+        self.request_timeout = fetch_config.get('request_timeout', 15)
+        # 每个文件（所有重试、退避等待和镜像合计）的时间上限，主机无响应时不会拖过会话超时
+        self.total_timeout = fetch_config.get('total_timeout', 45)
+        self.limiter = HostLimiter(
+            concurrency=fetch_config.get('per_host_concurrency', 4),
+            rate=fetch_config.get('per_host_rate', 5),
+            burst=fetch_config.get('per_host_burst')
+        )
+        self.fetch_stats = {'retries': 0, 'hedged': 0, 'mirror_wins': 0, 'fallbacks': 0, 'failures': 0}
+        
+        # 解析进程池：大文档在子进程中解析，不阻塞事件循环中的其他下载
+        parser_config = config.get('parser', {}) or {}
+        self.parser_workers = parser_config.get('workers', 'auto')
+        self.parser_queue_size = parser_config.get('queue_size', 4)
+        self.parser_min_bytes = parser_config.get('min_bytes', 256 * 1024)
+        self._pipeline = None
+        
+        # 除第一个来源（输出模板）外，其余订阅只提取proxies，不构造rules、proxy-groups等字段
+        self.proxies_only = parser_config.get('proxies_only', True)
+        self.template_source = self._first_source()
+    
+    def _first_source(self):
+        """按加载顺序排在第一位的来源，其完整配置用作输出模板"""
+        if self.local_files:
+            return self.local_files[0]
+        for repository in self.repositories:
+            paths = repository.get('paths', []) or []
+            if paths:
+                return f"{repository.get('owner')}/{repository.get('repo')}/{paths[0]}"
+        if self.yaml_urls:
+            return self.yaml_urls[0]
+        return None
     
-    async def fetch_content(self, session, url):
+    async def parse_config(self, content, source=None, proxies_only=None):
+        """解析配置文件内容
+        
+        proxies中的节点在解析时即完成校验，被过滤的无效节点数记录在_invalid字段，合并时不再重复校验。
+        不是模板来源的订阅只提取proxies（结果带_partial标记）。
+        启用解析缓存时，以内容摘要为键读取或保存结果；在fetch_all_configs中调用时，
+        大文档通过解析流水线交给进程池解析。
+        
+        Args:
+            content: YAML文本
+            source: 来源（文件路径、仓库路径或URL）
+            proxies_only: 是否只提取proxies，None表示按来源是否为模板决定
+            
+        Returns:
+            解析结果
+        """
+        if proxies_only is None:
+            proxies_only = self.proxies_only and source != self.template_source
+        digest = None
+        if self.parse_cache is not None:
+            # 只提取proxies的结果与完整解析的结果分开缓存
+            digest = self.parse_cache.digest(content) + ('-proxies' if proxies_only else '')
+            config_data = self.parse_cache.get(digest)
+            if config_data is not None:
+                return config_data
+        
+        if self._pipeline is not None:
+            config_data = await self._pipeline.parse(content, proxies_only)
+        else:
+            config_data = parse_document(content, proxies_only)
+        
+        if digest is not None and self._is_valid_clash_config(config_data):
+            self.parse_cache.put(digest, config_data)
+        return config_data
+    
+    async def fetch_content(self, session, url, use_cache=True, mirrors=()):
         """从URL获取文件内容
         
+        失败的请求按退避时间重试；主地址超过hedge_delay仍未响应时，同时向下一个镜像发起请求，
+        取最先成功的结果；主地址最终失败时依次换用镜像。所有地址的请求和重试共用total_timeout的时间预算。
+        
         Args:
             session: aiohttp会话
-            url: 文件URL
+            url: 文件URL（同时作为HTTP缓存的键）
+            use_cache: 是否发送条件请求；本地缓存损坏时以False重新完整下载
+            mirrors: 内容相同的镜像地址列表
             
         Returns:
             文件内容
@@ -52,23 +157,155 @@ class GitHubFetcher:
             # 显示当前请求的URL
             logger.debug(f"正在请求: {url}")
             
-            # 发送请求，如果有代理则使用代理
-            kwargs = {}
-            if self.proxy:
-                kwargs['proxy'] = self.proxy
-                
-            async with session.get(url, **kwargs) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    logger.info(f"成功获取配置文件: {url}")
-                    return content
-                else:
-                    logger.warning(f"获取配置文件失败: {url}, 状态码: {response.status}")
-                    return None
+            headers = {}
+            if self.cache and use_cache:
+                headers = self.cache.conditional_headers(url)
+            
+            status, content, response_headers = await self._hedged_get(session, [url] + list(mirrors), headers)
+            if status == 304 and self.cache:
+                content = self.cache.load(url)
+                if content is None:
+                    logger.warning(f"HTTP缓存已损坏，重新下载: {url}")
+                    return await self.fetch_content(session, url, use_cache=False, mirrors=mirrors)
+                logger.info(f"配置文件未变化，使用本地缓存: {url}")
+                return content
+            if self.cache:
+                self.cache.store(url, content, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+            logger.info(f"成功获取配置文件: {url}")
+            return content
+        except FetchError as e:
+            self.fetch_stats['failures'] += 1
+            logger.warning(f"获取配置文件失败: {url}, {str(e)}")
+            return None
         except Exception as e:
+            self.fetch_stats['failures'] += 1
             logger.error(f"获取配置文件时发生错误: {url}, 错误: {str(e)}")
             return None
     
+    async def _hedged_get(self, session, urls, headers):
+        """依次或对冲地请求一组内容相同的地址，返回最先成功的结果
+        
+        Args:
+            session: aiohttp会话
+            urls: 主地址在前的地址列表
+            headers: 发给主地址的请求头（条件请求头对镜像无意义）
+            
+        Returns:
+            (状态码, 内容, 响应头)
+            
+        Raises:
+            FetchError: 所有地址都失败
+        """
+        pending = {}  # task -> 地址序号
+        launched = 0
+        last_error = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.total_timeout
+        
+        def launch():
+            nonlocal launched
+            task = asyncio.create_task(
+                self._get_with_retry(session, urls[launched], headers if launched == 0 else {}, deadline)
+            )
+            pending[task] = launched
+            launched += 1
+        
+        launch()
+        try:
+            while pending:
+                # 在主机限流中排队的时间也计入时间预算
+                timeout = deadline - loop.time()
+                if self.hedge_delay and launched < len(urls):
+                    timeout = min(timeout, self.hedge_delay)
+                done, _ = await asyncio.wait(pending, timeout=max(0, timeout), return_when=asyncio.FIRST_COMPLETED)
+                if not done and loop.time() >= deadline:
+                    raise FetchError(f"超过 {self.total_timeout} 秒时间上限")
+                if not done:
+                    # 超过对冲阈值仍未完成，同时请求下一个镜像
+                    self.fetch_stats['hedged'] += 1
+                    logger.debug(f"请求超过 {self.hedge_delay} 秒未完成，同时请求镜像: {urls[launched]}")
+                    launch()
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except FetchError as e:
+                        last_error = e
+                        continue
+                    if index > 0:
+                        self.fetch_stats['mirror_wins'] += 1
+                    return result
+                if not pending and launched < len(urls):
+                    # 当前地址已失败，换下一个镜像
+                    self.fetch_stats['fallbacks'] += 1
+                    logger.info(f"改用镜像: {urls[launched]}")
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                # 任务可能在取消前已经失败，避免出现 "exception was never retrieved" 警告
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    async def _get_with_retry(self, session, url, headers, deadline=None):
+        """请求单个地址，网络错误、超时和限流/服务端错误按带抖动的指数退避重试
+        
+        Args:
+            session: aiohttp会话
+            url: 请求地址
+            headers: 请求头
+            deadline: 事件循环时间上的截止时刻；每次请求的超时不超过剩余时间，
+                剩余时间不够退避等待时不再重试
+            
+        Returns:
+            (状态码, 内容, 响应头)，状态码为200或304
+            
+        Raises:
+            FetchError: 重试次数或时间预算用完，或遇到不值得重试的状态码（如404）
+        """
+        # 发送请求，如果有代理则使用代理
+        kwargs = {'headers': headers}
+        if self.proxy:
+            kwargs['proxy'] = self.proxy
+        host = urlsplit(url).hostname or ''
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            deadline = loop.time() + self.total_timeout
+        
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.fetch_stats['retries'] += 1
+                await asyncio.sleep(delay)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise FetchError(f"超过 {self.total_timeout} 秒时间上限")
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=min(self.request_timeout, remaining))
+            try:
+                async with self.limiter.slot(host):
+                    async with session.get(url, **kwargs) as response:
+                        if response.status in (200, 304):
+                            content = await response.text() if response.status == 200 else None
+                            return response.status, content, response.headers
+                        error = FetchError(f"状态码: {response.status}", response.status,
+                                           response.status in RETRYABLE_STATUS)
+                        retry_after = response.headers.get('Retry-After', '')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = FetchError(f"网络错误: {type(e).__name__} {str(e)}")
+                retry_after = ''
+            
+            if not error.retryable:
+                raise error
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            if retry_after.isdigit():
+                # 服务器要求的等待时间，不超过退避上限
+                delay = max(delay, min(int(retry_after), self.backoff_max))
+            if attempt < self.retries and loop.time() + delay >= deadline:
+                # 等待后已没有时间再请求一次
+                raise error
+            logger.debug(f"请求失败，{delay:.1f} 秒后重试 ({attempt + 1}/{self.retries}): {url}, {str(error)}")
+        raise error
+    
     def read_local_file(self, file_path):
         """读取本地文件内容
         
@@ -108,8 +345,9 @@ class GitHubFetcher:
         if content:
             try:
                 # 尝试解析YAML内容
-                config_data = yaml.safe_load(content)
+                config_data = await self.parse_config(content, file_path)
                 if self._is_valid_clash_config(config_data):
+                    config_data['_source'] = file_path
                     logger.info(f"成功解析本地配置文件: {file_path}")
                     if progress and task_id:
                         progress.update(task_id, advance=1)
@@ -123,7 +361,7 @@ class GitHubFetcher:
             progress.update(task_id, advance=1)
         return None
     
-    async def fetch_github_content(self, session, owner, repo, path):
+    async def fetch_github_content(self, session, owner, repo, path, branch='master', mirrors=()):
         """从GitHub获取文件内容
         
         Args:
@@ -131,12 +369,67 @@ class GitHubFetcher:
             owner: 仓库拥有者
             repo: 仓库名称
             path: 文件路径
+            branch: 分支名称
+            mirrors: 镜像地址模板，可使用{owner}、{repo}、{branch}、{path}占位符
             
         Returns:
             文件内容
         """
-        url = f"https://raw.githubusercontent.com/{owner}/{repo}/master/{path}"
-        return await self.fetch_content(session, url)
+        url, mirror_urls = self._github_urls(owner, repo, path, branch, mirrors)
+        return await self.fetch_content(session, url, mirrors=mirror_urls)
+    
+    def _github_urls(self, owner, repo, path, branch='master', mirrors=()):
+        """GitHub文件的原始地址及按模板生成的镜像地址
+        
+        Returns:
+            (地址, 镜像地址列表)
+        """
+        fields = {'owner': owner, 'repo': repo, 'branch': branch, 'path': path}
+        url = "https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{path}".format(**fields)
+        mirror_urls = []
+        for pattern in mirrors:
+            try:
+                mirror_urls.append(pattern.format(**fields))
+            except (KeyError, IndexError, ValueError) as e:
+                logger.warning(f"无效的镜像地址模板: {pattern}, 错误: {str(e)}")
+        return url, mirror_urls
+    
+    async def load_template(self, session, source):
+        """重新获取一个来源的内容并完整解析，用于模板来源加载失败时替补输出模板
+        
+        本地文件重新读取；远程文件重新请求（有HTTP缓存时通常是304，不重复下载）。
+        
+        Args:
+            session: aiohttp会话
+            source: 来源（文件路径、仓库路径或URL）
+            
+        Returns:
+            完整的配置数据；失败时返回None
+        """
+        if source in self.local_files:
+            content = self.read_local_file(source)
+        else:
+            url, mirror_urls = source, []
+            for repository in self.repositories:
+                owner, repo = repository.get('owner'), repository.get('repo')
+                for path in repository.get('paths', []) or []:
+                    if f"{owner}/{repo}/{path}" == source:
+                        url, mirror_urls = self._github_urls(
+                            owner, repo, path, repository.get('branch', 'master'),
+                            repository.get('mirrors', []) or []
+                        )
+            content = await self.fetch_content(session, url, mirrors=mirror_urls)
+        if not content:
+            return None
+        try:
+            config_data = await self.parse_config(content, source, proxies_only=False)
+        except Exception as e:
+            logger.error(f"完整解析配置文件失败: {source}, 错误: {str(e)}")
+            return None
+        if not self._is_valid_clash_config(config_data):
+            return None
+        config_data['_source'] = source
+        return config_data
     
     async def fetch_repository_configs(self, session, repository, progress, task_id):
         """从仓库获取所有配置文件
@@ -153,15 +446,18 @@ class GitHubFetcher:
         owner = repository.get('owner')
         repo = repository.get('repo')
         paths = repository.get('paths', [])
+        branch = repository.get('branch', 'master')
+        mirrors = repository.get('mirrors', []) or []
         
         configs = []
         for path in paths:
-            content = await self.fetch_github_content(session, owner, repo, path)
+            content = await self.fetch_github_content(session, owner, repo, path, branch, mirrors)
             if content:
                 try:
                     # 尝试解析YAML内容
-                    config_data = yaml.safe_load(content)
+                    config_data = await self.parse_config(content, f"{owner}/{repo}/{path}")
                     if self._is_valid_clash_config(config_data):
+                        config_data['_source'] = f"{owner}/{repo}/{path}"
                         configs.append(config_data)
                         logger.info(f"成功解析配置文件: {owner}/{repo}/{path}")
                     else:
@@ -189,8 +485,9 @@ class GitHubFetcher:
         if content:
             try:
                 # 尝试解析YAML内容
-                config_data = yaml.safe_load(content)
+                config_data = await self.parse_config(content, url)
                 if self._is_valid_clash_config(config_data):
+                    config_data['_source'] = url
                     logger.info(f"成功解析配置文件: {url}")
                     if progress and task_id:
                         progress.update(task_id, advance=1)
@@ -214,8 +511,23 @@ class GitHubFetcher:
             是否是有效的Clash配置
         """
         # 简单检查，判断是否包含必要的字段
-        return (isinstance(config, dict) and 
-                ('proxies' in config or 'proxy-providers' in config or 'proxy-groups' in config))
+        return is_clash_config(config)
+    
+    async def _replace_template(self, session, configs):
+        """把第一个能完整解析的来源替换为完整配置，使输出保留其proxy-groups、rules等字段
+        
+        Args:
+            session: aiohttp会话
+            configs: 按加载顺序排列的配置列表，原地修改
+        """
+        for index, config in enumerate(configs):
+            source = config.get('_source')
+            template = await self.load_template(session, source)
+            if template is not None:
+                logger.warning(f"模板来源未能加载: {self.template_source}，改用 {source} 的完整配置作为模板")
+                console.print(f"[yellow]模板来源未能加载，改用 {source} 作为模板[/yellow]")
+                configs[index] = template
+                return
     
     async def fetch_all_configs(self, progress, task_id):
         """获取所有配置文件
@@ -238,52 +550,72 @@ class GitHubFetcher:
         }
         
         all_configs = []
+        if self.cache:
+            self.cache.reset_stats()
+        if self.parse_cache:
+            self.parse_cache.reset_stats()
+        self.fetch_stats = dict.fromkeys(self.fetch_stats, 0)
         
-        # 先加载本地文件
-        if self.local_files:
-            console.print("[yellow]正在加载本地配置文件...[/yellow]")
-            local_tasks = []
-            for file_path in self.local_files:
-                task = self.load_local_file(file_path, progress, task_id)
-                local_tasks.append(task)
-            
-            local_results = await asyncio.gather(*local_tasks, return_exceptions=True)
-            for result in local_results:
-                if isinstance(result, dict):
-                    all_configs.append(result)
-                elif isinstance(result, Exception):
-                    logger.error(f"加载本地配置文件时发生错误: {str(result)}")
-        
-        # 然后获取远程配置
-        # 创建会话
-        async with aiohttp.ClientSession(**session_kwargs) as session:
-            # 如果配置了代理，在请求时使用代理
-            proxy_kwarg = {}
-            if self.proxy:
-                proxy_kwarg['proxy'] = self.proxy
-            
-            tasks = []
-            
-            # 添加GitHub仓库任务
-            for repo in self.repositories:
-                task = self.fetch_repository_configs(session, repo, progress, task_id)
-                tasks.append(task)
-            
-            # 添加YAML URL任务
-            for url in self.yaml_urls:
-                task = self.fetch_yaml_url(session, url, progress, task_id)
-                tasks.append(task)
-            
-            # 等待所有任务完成
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 过滤出成功的结果
-            for result in results:
-                if isinstance(result, list):
-                    all_configs.extend(result)
-                elif isinstance(result, dict):
-                    all_configs.append(result)
-                elif isinstance(result, Exception):
-                    logger.error(f"获取配置文件时发生错误: {str(result)}")
+        workers = None if self.parser_workers in (None, 0, 'auto') else self.parser_workers
+        pipeline = ParsePipeline(workers, self.parser_queue_size, self.parser_min_bytes)
+        try:
+            async with pipeline, aiohttp.ClientSession(**session_kwargs) as session:
+                self._pipeline = pipeline
+                
+                # 本地文件与远程下载同时进行，解析在进程池中与下载重叠
+                local_tasks = []
+                if self.local_files:
+                    console.print("[yellow]正在加载本地配置文件...[/yellow]")
+                    for file_path in self.local_files:
+                        task = self.load_local_file(file_path, progress, task_id)
+                        local_tasks.append(task)
+                
+                tasks = []
+                
+                # 添加GitHub仓库任务
+                for repo in self.repositories:
+                    task = self.fetch_repository_configs(session, repo, progress, task_id)
+                    tasks.append(task)
+                
+                # 添加YAML URL任务
+                for url in self.yaml_urls:
+                    task = self.fetch_yaml_url(session, url, progress, task_id)
+                    tasks.append(task)
+                
+                # 等待所有任务完成
+                results = await asyncio.gather(*local_tasks, *tasks, return_exceptions=True)
+                
+                # 过滤出成功的结果，本地文件在前（第一个有效配置作为输出模板）
+                for index, result in enumerate(results):
+                    if isinstance(result, list):
+                        all_configs.extend(result)
+                    elif isinstance(result, dict):
+                        all_configs.append(result)
+                    elif isinstance(result, Exception):
+                        if index < len(local_tasks):
+                            logger.error(f"加载本地配置文件时发生错误: {str(result)}")
+                        else:
+                            logger.error(f"获取配置文件时发生错误: {str(result)}")
+                
+                # 模板来源缺失或加载失败时，其余结果都只有proxies；依次完整解析成功加载的来源作为模板
+                if all_configs and all(config.get('_partial') for config in all_configs):
+                    await self._replace_template(session, all_configs)
+        finally:
+            self._pipeline = None
+        
+        stats = self.fetch_stats
+        if stats['retries'] or stats['hedged'] or stats['fallbacks'] or stats['failures']:
+            report = (f"下载统计: 重试 {stats['retries']} 次, 对冲请求 {stats['hedged']} 次, "
+                      f"镜像胜出 {stats['mirror_wins']} 次, 改用镜像 {stats['fallbacks']} 次, 失败 {stats['failures']} 个")
+            logger.info(report)
+            console.print(f"[cyan]{report}[/cyan]")
+        if self.cache and self.cache.stats['requests']:
+            report = self.cache.report()
+            logger.info(report)
+            console.print(f"[cyan]{report}[/cyan]")
+        if self.parse_cache and (self.parse_cache.stats['hits'] or self.parse_cache.stats['misses']):
+            stats = self.parse_cache.stats
+            logger.info(f"解析缓存: 命中 {stats['hits']} 个, 重新解析 {stats['misses']} 个")
+            console.print(f"[cyan]解析缓存: 命中 {stats['hits']} 个, 重新解析 {stats['misses']} 个[/cyan]")
         
         return all_configs 
\ No newline at end of file
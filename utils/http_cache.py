@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP缓存 - 在磁盘上保存订阅文件内容及其ETag/Last-Modified，用条件请求避免重复下载未变化的文件
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+class HTTPCache:
+    """按URL保存响应内容和验证信息的磁盘缓存
+
+    每个URL对应两个文件：<key>.body 保存内容，<key>.json 保存ETag、Last-Modified等元数据。
+    请求时附带If-None-Match / If-Modified-Since，服务器返回304时直接使用本地内容。
+    """
+
+    def __init__(self, directory):
+        """初始化缓存
+
+        Args:
+            directory: 缓存目录
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空本轮统计"""
+        self.stats = {
+            'requests': 0,       # 发出的请求数
+            'hits': 0,           # 304命中次数
+            'misses': 0,         # 完整下载次数
+            'bytes_saved': 0,    # 304命中时未重复下载的字节数
+            'bytes_downloaded': 0,
+        }
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.json'
+
+    def _load_meta(self, url):
+        body_path, meta_path = self._paths(url)
+        if not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 防止哈希冲突或文件被替换
+        return meta if meta.get('url') == url else None
+
+    def conditional_headers(self, url):
+        """返回该URL的条件请求头，没有缓存时返回空字典
+
+        Args:
+            url: 请求地址
+
+        Returns:
+            请求头字典
+        """
+        self.stats['requests'] += 1
+        meta = self._load_meta(url)
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def load(self, url):
+        """服务器返回304时读取本地内容
+
+        Args:
+            url: 请求地址
+
+        Returns:
+            缓存的内容；缓存不存在或已损坏时返回None
+        """
+        if self._load_meta(url) is None:
+            return None
+        body_path, _ = self._paths(url)
+        try:
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += len(body)
+        return body.decode('utf-8')
+
+    def store(self, url, content, etag=None, last_modified=None):
+        """保存一次完整下载的内容
+
+        没有ETag和Last-Modified的响应无法做条件请求，只计入统计不保存。
+
+        Args:
+            url: 请求地址
+            content: 响应内容
+            etag: 响应头ETag
+            last_modified: 响应头Last-Modified
+        """
+        body = content.encode('utf-8')
+        self.stats['misses'] += 1
+        self.stats['bytes_downloaded'] += len(body)
+        if not etag and not last_modified:
+            return
+
+        body_path, meta_path = self._paths(url)
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': len(body),
+            'fetched_at': time.time(),
+        }
+        try:
+            # 先写临时文件再替换，中途退出也不会留下内容与元数据不一致的缓存
+            self._write_atomic(body_path, body)
+            self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"无法写入HTTP缓存: {url}, 错误: {str(e)}")
+
+    def _write_atomic(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def report(self):
+        """本轮缓存效果的摘要"""
+        stats = self.stats
+        answered = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / answered if answered else 0
+        return (f"HTTP缓存: {stats['requests']} 个请求, 命中(304) {stats['hits']} 个 ({ratio:.0%}), "
+                f"节省 {stats['bytes_saved'] / 1024:.1f} KB, 下载 {stats['bytes_downloaded'] / 1024:.1f} KB")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+延迟历史记录 - 将节点的测试结果持久化到SQLite，供后续运行复用
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# LatencyTester 写入节点的测试结果字段，计算节点标识时需要排除
+RESULT_FIELDS = (
+    'latency', 'latency_p90', 'jitter', 'loss',
+    'handshake_latency', 'address_family', 'kernel_rtt', 'kernel_rttvar',
+    'real_delay', 'throughput'
+)
+
+# 计算节点标识时忽略的字段（与 ProxyMerger 去重规则一致）
+IGNORED_FIELDS = ('name', 'udp', 'tfo')
+
+# 超过该时间（秒）未出现的节点记录会被清理
+PRUNE_AFTER = 30 * 24 * 3600
+
+class LatencyHistory:
+    """延迟历史记录，按节点标识保存EWMA延迟、成功率和最近测试时间"""
+
+    def __init__(self, path, ttl=3600, alpha=0.3):
+        """初始化历史记录
+
+        Args:
+            path: SQLite数据库文件路径
+            ttl: 测试结果的有效期（秒），超过后需要重新测试
+            alpha: EWMA平滑系数，越大越偏向最近一次结果
+        """
+        self.path = path
+        self.ttl = ttl
+        self.alpha = alpha
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS nodes ('
+            ' key TEXT PRIMARY KEY,'
+            ' ewma_latency REAL,'
+            ' success_rate REAL NOT NULL,'
+            ' last_ok INTEGER NOT NULL,'
+            ' last_tested REAL NOT NULL,'
+            ' last_seen REAL NOT NULL,'
+            ' probes INTEGER NOT NULL,'
+            ' result TEXT)'
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def node_key(proxy):
+        """计算节点的稳定标识，不受名称和测试结果字段影响
+
+        Args:
+            proxy: 代理节点字典
+
+        Returns:
+            节点标识
+        """
+        identity = {k: v for k, v in proxy.items()
+                    if k not in IGNORED_FIELDS and k not in RESULT_FIELDS and not str(k).startswith('_')}
+        try:
+            data = json.dumps(identity, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            data = repr(sorted(identity.items(), key=lambda item: str(item[0])))
+        return hashlib.md5(data.encode()).hexdigest()
+
+    def load(self, keys):
+        """批量读取节点记录
+
+        Args:
+            keys: 节点标识列表
+
+        Returns:
+            标识 -> 记录字典
+        """
+        records = {}
+        keys = list(keys)
+        # SQLite 单条语句的参数数量有限，分块查询
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                'SELECT key, ewma_latency, success_rate, last_ok, last_tested, probes, result '
+                f'FROM nodes WHERE key IN ({placeholders})', chunk
+            )
+            for key, ewma_latency, success_rate, last_ok, last_tested, probes, result in rows:
+                records[key] = {
+                    'ewma_latency': ewma_latency,
+                    'success_rate': success_rate,
+                    'last_ok': bool(last_ok),
+                    'last_tested': last_tested,
+                    'probes': probes,
+                    'result': json.loads(result) if result else {}
+                }
+        return records
+
+    def is_fresh(self, record, now=None):
+        """记录是否仍在有效期内"""
+        now = time.time() if now is None else now
+        return now - record['last_tested'] < self.ttl
+
+    def record(self, results, seen_keys=()):
+        """写入一批测试结果，并更新本次出现但未测试节点的last_seen
+
+        Args:
+            results: [(proxy, latency)] 列表，latency为-1表示失败
+            seen_keys: 本次出现过的节点标识
+        """
+        now = time.time()
+        keys = {self.node_key(proxy): (proxy, latency) for proxy, latency in results}
+        existing = self.load(keys)
+
+        rows = []
+        for key, (proxy, latency) in keys.items():
+            ok = latency >= 0
+            old = existing.get(key)
+            if old is None:
+                ewma_latency = latency if ok else None
+                success_rate = 1.0 if ok else 0.0
+                probes = 1
+            else:
+                ewma_latency = old['ewma_latency']
+                if ok:
+                    ewma_latency = latency if ewma_latency is None else \
+                        self.alpha * latency + (1 - self.alpha) * ewma_latency
+                success_rate = self.alpha * (1.0 if ok else 0.0) + (1 - self.alpha) * old['success_rate']
+                probes = old['probes'] + 1
+
+            result = {field: proxy[field] for field in RESULT_FIELDS if field in proxy} if ok else {}
+            rows.append((key, ewma_latency, success_rate, int(ok), now, now, probes, json.dumps(result)))
+
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO nodes '
+                '(key, ewma_latency, success_rate, last_ok, last_tested, last_seen, probes, result) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            seen = [(now, key) for key in seen_keys if key not in keys]
+            if seen:
+                self._conn.executemany('UPDATE nodes SET last_seen = ? WHERE key = ?', seen)
+            self._conn.execute('DELETE FROM nodes WHERE last_seen < ?', (now - PRUNE_AFTER,))
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
@@ -9,13 +9,146 @@ import logging
 import asyncio
 import socket
 import time
-import random
+import copy
+import heapq
+import queue
+import itertools
+import statistics
+import multiprocessing
 from rich.progress import Progress, TaskID
 from rich.console import Console
 
+from utils.dns_resolver import DNSResolver
+from utils.bogon_filter import BogonFilter
+from utils.probes import ProbeError, get_probe
+from utils.real_delay import RealDelayProbe, ThroughputProbe, DEFAULT_URL as REAL_DELAY_URL
+from utils.latency_history import LatencyHistory, RESULT_FIELDS
+from utils.circuit_breaker import EndpointBreaker
+from utils.node_selector import NodeSelector
+from utils.epoll_backend import EpollProber
+from utils.tcp_info import TCP_INFO, kernel_rtt
+
 logger = logging.getLogger(__name__)
 console = Console()
 
+# 探测结果分类
+OUTCOME_OK = 'ok'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_REFUSED = 'refused'
+OUTCOME_ERROR = 'error'
+
+# 分片子进程每积累多少个结果或多少秒回传一次
+SHARD_FLUSH_SIZE = 100
+SHARD_FLUSH_INTERVAL = 0.2
+
+# 每积累多少个测试结果写入一次历史记录
+HISTORY_FLUSH_SIZE = 500
+
+# 检查停止请求和截止时间的间隔（秒）
+STOP_POLL_INTERVAL = 0.2
+
+def _percentile(ordered, q):
+    """对已排序的列表按线性插值计算分位数"""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class _EndpointAbandoned(Exception):
+    """共享同一端点结果的测试被取消，等待者需要自行测试"""
+
+class TopKTracker:
+    """记录目前最快的K个合格节点的排序延迟（不超过延迟上限）"""
+    
+    def __init__(self, k, ceiling=None):
+        """初始化
+        
+        Args:
+            k: 目标节点数
+            ceiling: 延迟上限（毫秒），超过的节点不计入
+        """
+        self.k = k
+        self.ceiling = ceiling
+        self._heap = []  # 取负值的大顶堆，堆顶为第K快的延迟
+    
+    def add(self, latency):
+        """记录一个测试结果，失败（-1）或超过上限的结果被忽略"""
+        if latency < 0 or (self.ceiling is not None and latency > self.ceiling):
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -latency)
+        elif latency < -self._heap[0]:
+            heapq.heapreplace(self._heap, -latency)
+    
+    @property
+    def satisfied(self):
+        """是否已找到K个合格节点"""
+        return len(self._heap) >= self.k
+    
+    @property
+    def threshold(self):
+        """当前第K快的延迟（毫秒）"""
+        return -self._heap[0]
+
+class ConcurrencyWindow:
+    """探测并发窗口，控制同时在途的探测数量
+    
+    固定模式下窗口大小始终为初始值；自适应模式下每完成一轮（窗口大小个结果）
+    按AIMD调整：超时和拒绝比例超过阈值时减半，否则线性增加。
+    """
+    
+    def __init__(self, initial, minimum=None, maximum=None, adaptive=False,
+                 increase_step=1, failure_threshold=0.5):
+        """初始化并发窗口
+        
+        Args:
+            initial: 初始并发数
+            minimum: 最小并发数
+            maximum: 最大并发数
+            adaptive: 是否启用AIMD自适应
+            increase_step: 每轮增加的并发数
+            failure_threshold: 触发减半的超时/拒绝比例
+        """
+        self.limit = max(1, int(initial))
+        self.minimum = max(1, int(minimum if minimum is not None else self.limit // 4))
+        self.maximum = max(self.limit, int(maximum if maximum is not None else self.limit * 4))
+        self.adaptive = adaptive
+        self.increase_step = max(1, int(increase_step))
+        self.failure_threshold = failure_threshold
+        self._round_total = 0
+        self._round_failures = 0
+    
+    def record(self, outcome):
+        """记录一次探测结果，必要时调整窗口大小
+        
+        Args:
+            outcome: 探测结果分类
+        """
+        if not self.adaptive:
+            return
+        
+        self._round_total += 1
+        if outcome in (OUTCOME_TIMEOUT, OUTCOME_REFUSED):
+            self._round_failures += 1
+        
+        if self._round_total < self.limit:
+            return
+        
+        failure_rate = self._round_failures / self._round_total
+        old_limit = self.limit
+        if failure_rate > self.failure_threshold:
+            self.limit = max(self.minimum, self.limit // 2)
+        else:
+            self.limit = min(self.maximum, self.limit + self.increase_step)
+        
+        if self.limit != old_limit:
+            logger.debug(f"并发窗口调整: {old_limit} -> {self.limit} (失败率 {failure_rate:.0%})")
+        
+        self._round_total = 0
+        self._round_failures = 0
+
 class LatencyTester:
     """延迟测试器，用于测试代理节点的延迟并移除失效节点"""
     
@@ -30,11 +163,137 @@ class LatencyTester:
         self.timeout_ms = latency_config.get('timeout', 2000)  # 降低默认值为2000ms
         self.concurrent_tests = latency_config.get('concurrent_tests', 20)  # 降低默认值为20
         self.retry_count = latency_config.get('retry_count', 1)
-        self.batch_interval = latency_config.get('batch_interval', 1)  # 增加批次间隔默认为1秒
         self.max_nodes = latency_config.get('max_nodes', 300)  # 增加最大节点数限制
         
-        # 增加一个随机延迟，避免同时大量连接导致网络拥堵
-        random.seed(time.time())
+        # 自适应并发（AIMD），默认关闭，窗口固定为concurrent_tests
+        self.adaptive_concurrency = latency_config.get('adaptive_concurrency', False)
+        self.min_concurrent = latency_config.get('min_concurrent', max(1, self.concurrent_tests // 4))
+        self.max_concurrent = latency_config.get('max_concurrent', self.concurrent_tests * 4)
+        self.failure_threshold = latency_config.get('failure_threshold', 0.5)
+        
+        # 每个节点的采样次数和采样间隔（毫秒）
+        self.samples = max(1, latency_config.get('samples', 3))
+        self.sample_interval_ms = latency_config.get('sample_interval', 100)
+        
+        # 多地址并行连接时，相邻两次连接尝试的间隔（RFC 8305建议250ms）
+        self.happy_eyeballs_delay_ms = latency_config.get('happy_eyeballs_delay', 250)
+        
+        # TCP连接后按节点类型做协议握手（TLS / SOCKS5 / HTTP CONNECT）
+        self.protocol_probe = latency_config.get('protocol_probe', True)
+        self.connect_target = latency_config.get('connect_target', 'www.gstatic.com:443')
+        
+        # 真实延迟：socks5/http/shadowsocks节点经节点请求测试地址，记录到收到响应的时间(real_delay)，
+        # 并优先按它排序；其他类型仍做协议握手
+        real_delay_config = latency_config.get('real_delay', {}) or {}
+        self.real_delay_url = None
+        self.real_delay_timeout_ms = real_delay_config.get('timeout', 5000)
+        if real_delay_config.get('enable', False):
+            url = real_delay_config.get('url', REAL_DELAY_URL)
+            try:
+                RealDelayProbe(0, url=url)
+                self.real_delay_url = url
+            except ValueError as e:
+                logger.warning(f"真实延迟测试已禁用: {str(e)}")
+        
+        # 带宽测试：延迟测试排序后，对前top_n个支持的节点（socks5/http/shadowsocks）下载一段数据，
+        # 记录持续下载速度(throughput, KB/s)；延迟落在同一latency_bucket区间的节点按带宽从高到低排序
+        throughput_config = latency_config.get('throughput', {}) or {}
+        self.throughput_url = None
+        self.throughput_top_n = throughput_config.get('top_n', 20)
+        self.throughput_concurrent = max(1, throughput_config.get('concurrent', 4))
+        self.throughput_max_bytes = throughput_config.get('max_bytes', 1 << 20)
+        self.throughput_timeout_ms = throughput_config.get('timeout', 10000)
+        self.latency_bucket_ms = 0
+        if throughput_config.get('enable', False):
+            url = throughput_config.get('url', 'http://cachefly.cachefly.net/1mb.test')
+            try:
+                ThroughputProbe(0, url=url)
+                self.throughput_url = url
+                self.latency_bucket_ms = throughput_config.get('latency_bucket', 50)
+            except ValueError as e:
+                logger.warning(f"带宽测试已禁用: {str(e)}")
+        
+        # 保留地址过滤：服务器地址或解析结果为回环、私有、文档、组播等地址的节点不做任何网络测试
+        bogon_config = latency_config.get('bogon_filter', {}) or {}
+        self.bogon_filter = None
+        if bogon_config.get('enable', True):
+            self.bogon_filter = BogonFilter(
+                extra_prefixes=bogon_config.get('extra', []) or [],
+                allow_prefixes=bogon_config.get('allow', []) or []
+            )
+        
+        # 共享的DNS解析器，同一域名只解析一次并缓存
+        self.resolver = DNSResolver(
+            ttl=latency_config.get('dns_cache_ttl', 300),
+            negative_ttl=latency_config.get('dns_negative_ttl', 60),
+            workers=latency_config.get('dns_workers', 16),
+            bogon_filter=self.bogon_filter
+        )
+        
+        # 延迟历史记录，复用仍在有效期内的测试结果
+        history_config = latency_config.get('history', {}) or {}
+        self.history = None
+        self.recheck_margin = history_config.get('recheck_margin', 0.8)
+        if history_config.get('enable', False):
+            try:
+                self.history = LatencyHistory(
+                    history_config.get('file', 'latency_history.db'),
+                    ttl=history_config.get('ttl', 3600),
+                    alpha=history_config.get('ewma_alpha', 0.3)
+                )
+            except Exception as e:
+                logger.warning(f"无法打开延迟历史记录，将测试所有节点: {str(e)}")
+        
+        # 端点熔断：连续失败的端点在指数退避时间内不再测试，仅以小概率放行重新检测
+        breaker_config = latency_config.get('circuit_breaker', {}) or {}
+        self.breaker = None
+        if breaker_config.get('enable', False):
+            try:
+                self.breaker = EndpointBreaker(
+                    breaker_config.get('file', history_config.get('file', 'latency_history.db')),
+                    failure_threshold=breaker_config.get('failure_threshold', 3),
+                    base_backoff=breaker_config.get('base_backoff', 3600),
+                    max_backoff=breaker_config.get('max_backoff', 7 * 24 * 3600),
+                    readmit_rate=breaker_config.get('readmit_rate', 0.05)
+                )
+            except Exception as e:
+                logger.warning(f"无法打开端点熔断记录，将测试所有节点: {str(e)}")
+        
+        # 探测后端：asyncio（默认，支持握手探测和Happy Eyeballs）或 epoll（仅TCP连接，适合数万节点的高并发测试，
+        # 在途连接数按fd限制自动确定，socket以SO_LINGER 0中止以避免TIME_WAIT）
+        self.backend = latency_config.get('backend', 'asyncio')
+        self.epoll_max_in_flight = latency_config.get('epoll_max_in_flight')
+        
+        # 多进程分片测试：节点数不少于shard_threshold时，按shard_workers个进程分片，
+        # 每个进程运行自己的事件循环和并发窗口（总并发为 shard_workers * concurrent_tests）
+        self.shard_workers = latency_config.get('shard_workers', 0)
+        if self.shard_workers == 'auto':
+            self.shard_workers = multiprocessing.cpu_count()
+        self.shard_threshold = latency_config.get('shard_threshold', 2000)
+        
+        # Top-K提前结束：找到target_count个不超过latency_ceiling的节点后，不再启动新的测试，
+        # 并取消已经不可能比第K快节点更快的在途测试
+        self.target_count = latency_config.get('target_count', 0)
+        self.latency_ceiling = latency_config.get('latency_ceiling')
+        
+        # 同一端点（解析后的地址+端口+握手方式）只测试一次，结果分发给所有共享该端点的节点
+        self.endpoint_dedup = latency_config.get('endpoint_dedup', True)
+        
+        # 整轮测试的时间上限（秒），到时取消在途探测并返回已测得的结果；0表示不限制
+        self.deadline = latency_config.get('deadline', 0)
+        self._deadline_at = None
+        
+        # 本次测试提前结束的原因：None表示全部测试完成，
+        # 'target_reached'（Top-K已满足）、'deadline'（超过时间上限）或 'cancelled'（任务被停止）
+        self.stop_reason = None
+        self.stats = {}
+        
+        # 节点数超过max_nodes时的选择策略
+        selection_config = latency_config.get('selection', {}) or {}
+        self.selector = NodeSelector(
+            new_node_ratio=selection_config.get('new_node_ratio', 0.2),
+            timeout_ms=self.timeout_ms
+        )
     
     async def test_proxy(self, proxy):
         """测试单个代理节点的延迟
@@ -45,67 +304,403 @@ class LatencyTester:
         Returns:
             如果连接成功，返回(proxy, latency)，否则返回(proxy, -1)
         """
-        # 随机延迟开始测试，减轻突发连接压力
-        await asyncio.sleep(random.uniform(0, 0.5))
+        proxy, latency, _ = await self._test_proxy(proxy)
+        return proxy, latency
+    
+    async def _test_proxy(self, proxy, state=None, endpoints=None):
+        """测试单个代理节点的延迟，并给出结果分类
         
+        Args:
+            proxy: 代理节点字典
+            state: 可选的状态字典，由_measure写入first_sample和bound_since
+            endpoints: 本轮测试的端点结果表 {端点: Future}，给出时同一端点只测试一次；
+                只在一轮测试内有效，避免长期使用的测试器返回过期（包括失败的）结果
+            
+        Returns:
+            (proxy, latency, outcome)，失败时latency为-1
+        """
         server = proxy.get('server')
         port = proxy.get('port')
         
         if not self._is_valid_address(server) or not port:
             logger.warning(f"无效的服务器地址或端口: {server}:{port}")
-            return proxy, -1
+            return proxy, -1, OUTCOME_ERROR
         
         # 设置超时时间更短，避免卡死
         timeout_seconds = min(self.timeout_ms / 1000, 2.0)  # 最大2秒
         
-        latency = -1  # 默认为-1表示失败
-        
         # 尝试解析域名，获取地址信息
         try:
-            # 尝试获取地址信息
-            addrinfo = socket.getaddrinfo(server, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+            # 通过共享解析器解析（带缓存，不阻塞事件循环）
+            addrinfo = await self.resolver.resolve(server, port)
             
-            # 我们将尝试第一个可用的地址
-            for retry in range(self.retry_count):
-                for family, socktype, proto, canonname, sockaddr in addrinfo:
-                    try:
-                        # 创建适当类型的socket
-                        sock = socket.socket(family, socktype, proto)
-                        sock.settimeout(timeout_seconds)
-                        
-                        # 连接
-                        start_time = time.time()
-                        sock.connect(sockaddr)
-                        end_time = time.time()
-                        
-                        # 计算延迟（毫秒）
-                        latency = int((end_time - start_time) * 1000)
-                        
-                        # 更新代理信息
-                        proxy['latency'] = latency
-                        
-                        # 关闭连接
-                        sock.close()
-                        
-                        # 延迟测试成功，返回
-                        return proxy, latency
-                    except (socket.timeout, ConnectionRefusedError, OSError) as e:
-                        if sock:
-                            sock.close()
-                        # 记录失败，尝试下一个地址
-                        continue
+            if endpoints is None:
+                latency, outcome = await self._measure(proxy, addrinfo, timeout_seconds, state)
+                return proxy, latency, outcome
+            
+            # 解析到相同地址且握手方式相同的节点只测试一次，其余节点共享结果
+            key = (self._probe_signature(proxy), tuple(sorted({tuple(info[4][:2]) for info in addrinfo})))
+            future = endpoints.get(key)
+            if future is not None:
+                try:
+                    latency, outcome, fields = await asyncio.shield(future)
+                except _EndpointAbandoned:
+                    latency, outcome = await self._measure(proxy, addrinfo, timeout_seconds, state)
+                    return proxy, latency, outcome
+                proxy.update(fields)
+                return proxy, latency, outcome
             
-            # 如果所有地址都失败
-            return proxy, -1
+            future = asyncio.get_running_loop().create_future()
+            endpoints[key] = future
+            try:
+                latency, outcome = await self._measure(proxy, addrinfo, timeout_seconds, state)
+            except BaseException:
+                # 本次测试被取消或出错，等待中的节点各自重新测试
+                endpoints.pop(key, None)
+                future.set_exception(_EndpointAbandoned())
+                future.exception()
+                raise
+            future.set_result((latency, outcome, {field: proxy[field] for field in RESULT_FIELDS if field in proxy}))
+            return proxy, latency, outcome
             
         except (socket.gaierror, socket.error) as e:
             # 无法解析域名或其他错误
             logger.debug(f"无法连接到服务器 {server}:{port} - {str(e)}")
-            return proxy, -1
+            return proxy, -1, OUTCOME_ERROR
         except Exception as e:
             # 捕获所有其他异常
             logger.debug(f"测试代理时发生错误 {server}:{port} - {str(e)}")
-            return proxy, -1
+            return proxy, -1, OUTCOME_ERROR
+    
+    async def _measure(self, proxy, addrinfo, timeout_seconds, state=None):
+        """对已解析的节点进行多次采样测试，结果写入节点字典
+        
+        Args:
+            proxy: 代理节点字典
+            addrinfo: getaddrinfo格式的地址列表
+            timeout_seconds: 单次连接/握手超时时间（秒）
+            state: 可选的状态字典，供Top-K模式判断在途探测能否进入前K：
+                first_sample为第一次成功采样的延迟（毫秒），与ranking_delay口径相同；
+                bound_since为一个时刻，此后经过的时间是该延迟的下界（有内核RTT时不写入）
+            
+        Returns:
+            (latency, outcome)，失败时latency为-1
+        """
+        server = proxy.get('server')
+        port = proxy.get('port')
+        
+        outcome = OUTCOME_ERROR
+        samples = []
+        kernel_samples = []
+        failures = 0
+        attempts = 0
+        target = addrinfo
+        handshake_done = False
+        
+        # 采样K次；前retry_count次全部失败则提前放弃，失效节点不会放大测试时间
+        for attempt in range(max(self.samples, self.retry_count)):
+            if not samples and failures >= self.retry_count:
+                break
+            if samples and attempt >= self.samples:
+                break
+            if attempt > 0 and self.sample_interval_ms > 0:
+                await asyncio.sleep(self.sample_interval_ms / 1000)
+            
+            attempts += 1
+            track = state is not None and 'first_sample' not in state
+            if track and TCP_INFO is None and len(target) == 1 and not self._uses_real_delay(proxy):
+                # 没有内核RTT时按连接耗时排序，连接未完成时已等待的时间就是它的下界
+                state['bound_since'] = time.monotonic()
+            try:
+                # 所有地址错开并行连接（Happy Eyeballs），最先成功的一个胜出，后续采样只连接胜出的地址
+                latency, info, sock = await self._race_connect(target, timeout_seconds)
+                rtt = kernel_rtt(sock)
+                if handshake_done:
+                    sock.close()
+                elif self._uses_real_delay(proxy):
+                    probe = RealDelayProbe(self.real_delay_timeout_ms / 1000, url=self.real_delay_url)
+                    if track:
+                        # 真实延迟从握手开始计时
+                        state['bound_since'] = time.monotonic()
+                    proxy['real_delay'] = await probe.run(sock, proxy)
+                    handshake_done = True
+                else:
+                    handshake_latency = await self._handshake(sock, proxy, timeout_seconds)
+                    handshake_done = True
+                    if handshake_latency is not None:
+                        proxy['handshake_latency'] = handshake_latency
+            except asyncio.TimeoutError:
+                outcome = OUTCOME_TIMEOUT
+                failures += 1
+                continue
+            except ConnectionRefusedError:
+                outcome = OUTCOME_REFUSED
+                failures += 1
+                continue
+            except (OSError, ProbeError) as e:
+                # 记录失败，进行下一次尝试
+                logger.debug(f"测试节点失败 {server}:{port} - {str(e)}")
+                failures += 1
+                continue
+            
+            samples.append(latency)
+            if rtt is not None:
+                kernel_samples.append(rtt)
+            if track:
+                # 与ranking_delay口径相同：真实延迟、内核RTT，最后是连接耗时
+                state['first_sample'] = proxy.get('real_delay', rtt[0] if rtt is not None else latency)
+            if target is addrinfo:
+                target = [info]
+                proxy['address_family'] = 'ipv6' if info[0] == socket.AF_INET6 else 'ipv4'
+        
+        if not samples:
+            # 如果所有尝试都失败
+            return -1, outcome
+        
+        # 更新代理信息
+        proxy.update(self._summarize(samples, attempts, kernel_samples))
+        
+        # 延迟测试成功，返回
+        return proxy['latency'], OUTCOME_OK
+    
+    def _probe_signature(self, proxy):
+        """节点的握手方式，握手方式相同的同一端点可以共享测试结果
+        
+        Args:
+            proxy: 代理节点字典
+            
+        Returns:
+            (探测类型, 是否TLS, SNI)
+        """
+        if self._uses_real_delay(proxy):
+            # 真实延迟与认证信息有关，只有配置完全相同的节点才能共享结果
+            return ('RealDelayProbe', bool(proxy.get('tls')), LatencyHistory.node_key(proxy))
+        probe = get_probe(proxy, 0, self.connect_target) if self.protocol_probe else None
+        if probe is None:
+            return ('tcp', False, None)
+        tls = probe.uses_tls(proxy)
+        return (type(probe).__name__, tls, probe.server_name(proxy) if tls else None)
+    
+    def _group_endpoints(self, proxies):
+        """按 (服务器, 端口, 握手方式) 对节点分组，每组只需测试第一个节点
+        
+        Args:
+            proxies: 代理节点列表
+            
+        Returns:
+            分组列表，每个分组为节点列表
+        """
+        groups = {}
+        for proxy in proxies:
+            key = (str(proxy.get('server', '')).lower(), proxy.get('port'), self._probe_signature(proxy))
+            groups.setdefault(key, []).append(proxy)
+        return list(groups.values())
+    
+    async def _race_connect(self, addrinfo, timeout):
+        """按RFC 8305错开并行连接所有地址，返回最先成功的连接
+        
+        每隔happy_eyeballs_delay启动下一个地址的连接，前一个失败时立即启动下一个；
+        任一连接成功后取消其余连接。
+        
+        Args:
+            addrinfo: getaddrinfo格式的地址列表
+            timeout: 单次连接超时时间（秒）
+            
+        Returns:
+            (latency, addrinfo项, sock)，sock为已连接的socket，由调用方负责关闭
+            
+        Raises:
+            asyncio.TimeoutError: 存在超时的地址且没有地址连接成功
+            OSError: 所有地址都连接失败
+        """
+        attempts = self._interleave_families(addrinfo)
+        delay = self.happy_eyeballs_delay_ms / 1000
+        pending = {}
+        errors = []
+        next_index = 0
+        
+        try:
+            while next_index < len(attempts) or pending:
+                if next_index < len(attempts):
+                    family, socktype, proto, canonname, sockaddr = attempts[next_index]
+                    next_index += 1
+                    task = asyncio.create_task(self._connect(family, socktype, proto, sockaddr, timeout))
+                    pending[task] = attempts[next_index - 1]
+                
+                wait_timeout = delay if next_index < len(attempts) else None
+                done, _ = await asyncio.wait(pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    info = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        latency, sock = task.result()
+                        return latency, info, sock
+                    errors.append(error)
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # 同一轮中同时成功的其他连接
+                    task.result()[1].close()
+        
+        for error_type in (asyncio.TimeoutError, ConnectionRefusedError):
+            for error in errors:
+                if isinstance(error, error_type):
+                    raise error
+        raise errors[-1] if errors else OSError("没有可用的地址")
+    
+    def _interleave_families(self, addrinfo):
+        """按RFC 8305交替排列IPv6和IPv4地址，IPv6优先
+        
+        Args:
+            addrinfo: getaddrinfo格式的地址列表
+            
+        Returns:
+            重新排序后的地址列表
+        """
+        ipv6 = [info for info in addrinfo if info[0] == socket.AF_INET6]
+        others = [info for info in addrinfo if info[0] != socket.AF_INET6]
+        ordered = []
+        for pair in itertools.zip_longest(ipv6, others):
+            ordered.extend(info for info in pair if info is not None)
+        return ordered
+    
+    async def _connect(self, family, socktype, proto, sockaddr, timeout):
+        """使用非阻塞socket建立一次TCP连接并计时
+        
+        Args:
+            family: 地址族
+            socktype: socket类型
+            proto: 协议
+            sockaddr: 目标地址
+            timeout: 超时时间（秒）
+            
+        Returns:
+            (连接耗时（毫秒，浮点数）, 已连接的socket)
+            
+        Raises:
+            asyncio.TimeoutError: 连接超时
+            OSError: 连接被拒绝或网络不可达
+        """
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setblocking(False)
+            start_ns = time.perf_counter_ns()
+            await asyncio.wait_for(loop.sock_connect(sock, sockaddr), timeout)
+            end_ns = time.perf_counter_ns()
+        except BaseException:
+            sock.close()
+            raise
+        
+        # 计算延迟（毫秒）
+        return (end_ns - start_ns) / 1_000_000, sock
+    
+    async def _handshake(self, sock, proxy, timeout):
+        """在已连接的socket上按节点类型做协议握手，完成后关闭socket
+        
+        Args:
+            sock: 已连接的socket
+            proxy: 代理节点字典
+            timeout: 握手超时时间（秒）
+            
+        Returns:
+            握手耗时（毫秒）；未启用或该类型没有握手探测时返回None
+            
+        Raises:
+            ProbeError: 协议响应不符合预期
+            asyncio.TimeoutError: 握手超时
+            OSError: 连接被重置等网络错误
+        """
+        probe = get_probe(proxy, timeout, self.connect_target) if self.protocol_probe else None
+        if probe is None:
+            sock.close()
+            return None
+        return await probe.run(sock, proxy)
+    
+    def _summarize(self, samples, attempts, kernel_samples=()):
+        """根据多次采样计算延迟统计
+        
+        Args:
+            samples: 成功采样的延迟列表（毫秒）
+            attempts: 总尝试次数
+            kernel_samples: 内核测得的 (rtt, rttvar) 列表（毫秒），仅Linux可用
+            
+        Returns:
+            延迟统计字典：latency（中位数）、latency_p90、jitter、loss，
+            有内核数据时另含kernel_rtt、kernel_rttvar（中位数）
+        """
+        ordered = sorted(samples)
+        # 相邻两次采样差值的平均值
+        if len(samples) > 1:
+            jitter = sum(abs(b - a) for a, b in zip(samples, samples[1:])) / (len(samples) - 1)
+        else:
+            jitter = 0.0
+        
+        summary = {
+            'latency': int(round(statistics.median(ordered))),
+            'latency_p90': int(round(_percentile(ordered, 0.9))),
+            'jitter': round(jitter, 1),
+            'loss': round(1 - len(samples) / attempts, 2)
+        }
+        if kernel_samples:
+            summary['kernel_rtt'] = round(statistics.median(rtt for rtt, _ in kernel_samples), 2)
+            summary['kernel_rttvar'] = round(statistics.median(rttvar for _, rttvar in kernel_samples), 2)
+        return summary
+    
+    def is_valid_latency(self, latency, proxy=None):
+        """测试结果是否为可输出的有效节点（成功且不超过延迟上限）
+        
+        Args:
+            latency: 测试结果，-1表示失败
+            proxy: 测试过的节点；给出时按排序使用的延迟（见ranking_delay）与延迟上限比较
+        """
+        if latency < 0:
+            return False
+        if proxy is not None:
+            latency = self.ranking_delay(proxy, latency)
+        return self.latency_ceiling is None or latency <= self.latency_ceiling
+    
+    def ranking_delay(self, proxy, latency):
+        """排序使用的延迟：测得真实延迟时用真实延迟，其次是内核RTT，最后是延迟中位数
+        
+        延迟上限和Top-K目标都按这个值判断，与sort_key的排序一致。
+        
+        Args:
+            proxy: 测试过的节点
+            latency: 测试结果（延迟中位数），-1表示失败
+            
+        Returns:
+            延迟（毫秒）；测试失败时返回-1
+        """
+        if latency < 0:
+            return -1
+        return proxy.get('real_delay', proxy.get('kernel_rtt', latency))
+    
+    def _uses_real_delay(self, proxy):
+        return self.real_delay_url is not None and RealDelayProbe.supports(proxy)
+    
+    def sort_key(self, proxy):
+        """有效节点的排序键：测得真实延迟的节点排在前面并按真实延迟排序；
+        其余节点按延迟中位数（有内核RTT时优先使用，不受并发调度噪声影响），再按p90和丢包率"""
+        group = 0 if 'real_delay' in proxy else 1
+        delay = self.ranking_delay(proxy, proxy.get('latency', float('inf')))
+        # 带宽作为次要排序键：启用带宽测试时，延迟落在同一区间的节点按带宽从高到低排列
+        bucket = delay // self.latency_bucket_ms if self.latency_bucket_ms and delay != float('inf') else delay
+        return (group, bucket, -proxy.get('throughput', 0), delay,
+                proxy.get('latency_p90', float('inf')), proxy.get('loss', 1.0))
+    
+    def _is_valid_address(self, server):
+        """检查服务器地址是否可用于测试
+        
+        Args:
+            server: 服务器地址
+            
+        Returns:
+            是否有效
+        """
+        return isinstance(server, str) and bool(server.strip())
     
     async def test_batch(self, proxies, progress=None, task_id=None):
         """测试一批代理节点
@@ -141,7 +736,7 @@ class LatencyTester:
         for result in results:
             if isinstance(result, tuple) and len(result) == 2:
                 proxy, latency = result
-                if latency > 0:  # 延迟大于0表示节点有效
+                if latency >= 0:  # 延迟不为-1表示节点有效
                     valid_proxies.append(proxy)
             elif isinstance(result, Exception):
                 logger.error(f"测试节点时发生错误: {str(result)}")
@@ -162,51 +757,570 @@ class LatencyTester:
             logger.warning("没有代理节点可供测试")
             return []
         
+        valid_proxies = []
+        async for proxy, latency in self.stream(proxies, task_status):
+            if self.is_valid_latency(latency, proxy):
+                valid_proxies.append(proxy)
+            
+            # 更新任务进度（如果提供了任务状态）
+            if task_status and self.stats['total']:
+                progress_value = int(60 + self.stats['completed'] / self.stats['total'] * 30)  # 60%-90%之间更新进度
+                task_status['progress'] = min(progress_value, 90)
+        
+        # 按延迟排序，再对排名靠前的节点做带宽测试
+        valid_proxies.sort(key=self.sort_key)
+        if self.throughput_url:
+            await self.measure_throughput(valid_proxies, task_status)
+            valid_proxies.sort(key=self.sort_key)
+        return valid_proxies
+    
+    async def measure_throughput(self, ranked_proxies, task_status=None):
+        """对延迟排名靠前的节点做带宽测试，结果写入节点的throughput字段（KB/s）
+        
+        只测试支持的节点类型中的前top_n个，并发数由throughput.concurrent单独限制。
+        
+        Args:
+            ranked_proxies: 按sort_key排好序的有效节点列表
+            task_status: 任务状态字典，running为False时停止测试
+        """
+        if not self.throughput_url:
+            return
+        candidates = [proxy for proxy in ranked_proxies if RealDelayProbe.supports(proxy)][:self.throughput_top_n]
+        if not candidates:
+            return
+        
+        console.print(f"[cyan]正在测试前 {len(candidates)} 个节点的带宽...[/cyan]")
+        semaphore = asyncio.Semaphore(self.throughput_concurrent)
+        
+        async def run(proxy):
+            async with semaphore:
+                rate = await self._measure_throughput(proxy)
+                if rate is not None:
+                    proxy['throughput'] = rate
+        
+        pending = {asyncio.create_task(run(proxy)) for proxy in candidates}
+        try:
+            while pending and not self._should_stop(task_status):
+                _, pending = await asyncio.wait(pending, timeout=self._poll_timeout())
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        measured = sum(1 for proxy in candidates if 'throughput' in proxy)
+        logger.info(f"带宽测试完成: {measured}/{len(candidates)} 个节点")
+    
+    async def _measure_throughput(self, proxy):
+        """建立新连接并经节点下载，返回持续下载速度（KB/s），失败时返回None"""
+        timeout_seconds = self.throughput_timeout_ms / 1000
+        try:
+            addrinfo = await self.resolver.resolve(proxy.get('server'), proxy.get('port'))
+            _, _, sock = await self._race_connect(addrinfo, min(self.timeout_ms / 1000, 2.0))
+            probe = ThroughputProbe(timeout_seconds, url=self.throughput_url,
+                                    max_bytes=self.throughput_max_bytes, duration=timeout_seconds / 2)
+            await probe.run(sock, proxy)
+            return probe.rate
+        except (asyncio.TimeoutError, OSError, ProbeError) as e:
+            logger.debug(f"带宽测试失败 {proxy.get('server')}:{proxy.get('port')} - {str(e)}")
+            return None
+    
+    async def stream(self, proxies, task_status=None):
+        """测试代理节点，并按完成顺序逐个产出结果
+        
+        用法: async for proxy, latency in tester.stream(proxies): ...
+        历史记录中复用的结果最先产出；测试进度和吞吐量可随时从 stats / throughput() 读取。
+        
+        Args:
+            proxies: 代理节点列表
+            task_status: 任务状态字典，running为False时停止测试
+            
+        Yields:
+            (proxy, latency)，失败时latency为-1
+        """
+        self.stop_reason = None
+        self.stats = {
+            'total': 0,
+            'completed': 0,
+            'valid': 0,
+            'cached': 0,
+            'truncated': False,
+            'skipped': 0,
+            'bogon': 0,
+            'started_at': time.monotonic(),
+            'probe_started_at': None
+        }
+        self._deadline_at = self.stats['started_at'] + self.deadline if self.deadline else None
+        if not proxies:
+            return
+        
         # 使用我们自己的进度显示，而不是嵌套的Progress
         console.print("[cyan]正在测试节点延迟...[/cyan]")
         
+        # 服务器地址为保留地址的节点直接丢弃，不查历史记录也不占测试名额
+        if self.bogon_filter:
+            proxies, rejected = self.bogon_filter.split(proxies)
+            if rejected:
+                self.stats['bogon'] = len(rejected)
+                logger.info(f"保留地址过滤: 丢弃 {len(rejected)} 个服务器地址为回环/私有/保留地址的节点")
+                console.print(f"[cyan]丢弃 {len(rejected)} 个服务器地址为保留地址的节点[/cyan]")
+        
+        # 复用历史记录中仍然有效的结果，只测试新节点、过期节点和接近阈值的节点
+        cached_proxies = []
+        seen_keys = []
+        records = {}
+        if self.history:
+            seen_keys = [LatencyHistory.node_key(proxy) for proxy in proxies]
+            records = self.history.load(seen_keys)
+            cached_proxies, proxies = self._reuse_history(proxies, seen_keys, records)
+        
+        # 跳过处于熔断期的端点，把测试名额留给可能存活的节点
+        if self.breaker:
+            proxies, blocked, readmitted = self.breaker.admit(proxies)
+            if blocked or readmitted:
+                logger.info(f"端点熔断: 跳过 {blocked} 个节点, 放行 {readmitted} 个熔断端点重新检测")
+                console.print(f"[cyan]跳过 {blocked} 个持续失效端点上的节点[/cyan]")
+        
         # 检查是否超过最大节点数
         if len(proxies) > self.max_nodes:
-            logger.warning(f"节点数量({len(proxies)})超过最大限制({self.max_nodes})，将随机选择{self.max_nodes}个节点进行测试")
+            logger.warning(f"节点数量({len(proxies)})超过最大限制({self.max_nodes})，将按历史表现和来源挑选{self.max_nodes}个节点进行测试")
             console.print(f"[yellow]节点数量过多，将只测试{self.max_nodes}个节点[/yellow]")
-            random.shuffle(proxies)
-            proxies = proxies[:self.max_nodes]
+            keys = [LatencyHistory.node_key(proxy) for proxy in proxies] if self.history else None
+            proxies = self.selector.select(proxies, self.max_nodes, keys, records)
+        
+        # Top-K模式下历史记录中的有效节点也计入目标数量
+        top_k = None
+        if self.target_count:
+            top_k = TopKTracker(self.target_count, self.latency_ceiling)
+            for proxy in cached_proxies:
+                top_k.add(self.ranking_delay(proxy, proxy.get('latency', -1)))
+        
+        stats = self.stats
+        stats['total'] = len(cached_proxies) + len(proxies)
+        stats['cached'] = len(cached_proxies)
+        
+        for proxy in cached_proxies:
+            stats['completed'] += 1
+            stats['valid'] += 1
+            yield proxy, proxy.get('latency', -1)
+        
+        # 同一端点的节点只测试第一个，结果分发给组内其他节点
+        targets = proxies
+        groups = {}
+        if self.endpoint_dedup:
+            grouped = self._group_endpoints(proxies)
+            targets = [group[0] for group in grouped]
+            groups = {id(group[0]): group for group in grouped if len(group) > 1}
+            if len(targets) < len(proxies):
+                logger.info(f"端点去重: {len(proxies)} 个节点共 {len(targets)} 个不同端点")
+        
+        # 滑动窗口调度：始终保持窗口大小个探测在途，一个完成立即补上下一个
+        if self.shard_workers and self.shard_workers > 1 and len(targets) >= self.shard_threshold:
+            probe_results = self._probe_sharded(targets, task_status, top_k)
+        elif self.backend == 'epoll':
+            probe_results = self._probe_epoll(targets, task_status, top_k)
+        else:
+            probe_results = self._probe_window(targets, task_status, top_k)
+        
+        # 测试结果分批写入历史记录和熔断记录，避免在内存中保留全部结果
+        pending_results = []
+        probed = 0
+        report_every = max(1, len(proxies) // 10)
+        stats['probe_started_at'] = time.monotonic()
+        try:
+            async for tested, latency in probe_results:
+                fields = {field: tested[field] for field in RESULT_FIELDS if field in tested} if latency >= 0 else {}
+                for proxy in groups.get(id(tested), (tested,)):
+                    if proxy is not tested:
+                        proxy.update(fields)
+                    
+                    probed += 1
+                    stats['completed'] += 1
+                    if latency >= 0:
+                        stats['valid'] += 1
+                    if top_k:
+                        top_k.add(self.ranking_delay(proxy, latency))
+                    if self.history or self.breaker:
+                        pending_results.append((proxy, latency))
+                        if len(pending_results) >= HISTORY_FLUSH_SIZE:
+                            self._record_results(pending_results)
+                            pending_results = []
+                    
+                    if probed % report_every == 0 or probed == len(proxies):
+                        console.print(f"[green]已测试 {probed}/{len(proxies)} 个节点，有效节点: {stats['valid'] - stats['cached']}，"
+                                      f"速率 {self.throughput():.1f} 个/秒[/green]")
+                    
+                    yield proxy, latency
+        finally:
+            await probe_results.aclose()
+            self._record_results(pending_results, seen_keys)
             
-        # 分批测试，避免并发太多
-        batches = [proxies[i:i+self.concurrent_tests] for i in range(0, len(proxies), self.concurrent_tests)]
-        valid_proxies = []
+            if probed < len(proxies):
+                stats['truncated'] = True
+                stats['skipped'] = len(proxies) - probed
+                if top_k and top_k.satisfied:
+                    self.stop_reason = 'target_reached'
+                    logger.info(f"已找到 {self.target_count} 个满足条件的节点，提前结束测试 (跳过 {len(proxies) - probed} 个节点)")
+                    console.print(f"[green]已找到 {self.target_count} 个满足条件的节点，提前结束测试[/green]")
+                elif self._deadline_passed():
+                    self.stop_reason = 'deadline'
+                    logger.warning(f"延迟测试超过时间上限 {self.deadline} 秒，返回已测试的节点 (跳过 {len(proxies) - probed} 个节点)")
+                    console.print(f"[yellow]延迟测试超过时间上限 {self.deadline} 秒，返回已测试的节点[/yellow]")
+                else:
+                    self.stop_reason = 'cancelled'
+                    logger.info("测试任务被中断，返回已测试的节点")
+                    console.print("[yellow]测试任务被中断，返回已测试的节点[/yellow]")
+            
+            logger.info(f"延迟测试完成: {stats['valid']} 个有效节点 (其中 {stats['cached']} 个来自历史记录), "
+                        f"{stats['completed'] - stats['valid']} 个无效节点, 速率 {self.throughput():.1f} 个/秒")
+            
+            dns_stats = self.resolver.stats
+            logger.info(f"DNS解析: 缓存命中 {dns_stats['hits']}, 合并 {dns_stats['coalesced']}, "
+                        f"实际解析 {dns_stats['misses']}, 失败 {dns_stats['failures']}")
+    
+    def _deadline_passed(self):
+        return self._deadline_at is not None and time.monotonic() >= self._deadline_at
+    
+    def _should_stop(self, task_status):
+        """任务被停止或超过截止时间时返回True"""
+        if task_status and not task_status.get('running', True):
+            return True
+        return self._deadline_passed()
+    
+    def _poll_timeout(self, timeout=None):
+        """等待结果的最长时间：不超过轮询间隔和距截止时间的剩余时间"""
+        timeout = STOP_POLL_INTERVAL if timeout is None else min(timeout, STOP_POLL_INTERVAL)
+        if self._deadline_at is not None:
+            timeout = min(timeout, max(0, self._deadline_at - time.monotonic()))
+        return timeout
+    
+    def throughput(self):
+        """本次测试的实际探测速率（个/秒），不含历史记录复用的节点"""
+        started_at = self.stats.get('probe_started_at')
+        if not started_at:
+            return 0.0
+        elapsed = time.monotonic() - started_at
+        probed = self.stats['completed'] - self.stats['cached']
+        return probed / elapsed if elapsed > 0 else 0.0
+    
+    def _record_results(self, results, seen_keys=()):
+        """写入一批测试结果到历史记录和熔断记录，失败时只记录警告"""
+        if self.history and (results or seen_keys):
+            try:
+                self.history.record(results, seen_keys)
+            except Exception as e:
+                logger.warning(f"保存延迟历史记录失败: {str(e)}")
+        if self.breaker and results:
+            try:
+                self.breaker.record(results)
+            except Exception as e:
+                logger.warning(f"保存端点熔断记录失败: {str(e)}")
+    
+    def _reuse_history(self, proxies, keys, records):
+        """根据历史记录划分节点：可直接复用结果的有效节点和需要重新测试的节点
         
-        for i, batch in enumerate(batches):
-            # 检查任务是否被取消
-            if task_status and not task_status.get('running', True):
-                logger.info("测试任务被中断，返回已测试的节点")
-                console.print("[yellow]测试任务被中断，返回已测试的节点[/yellow]")
-                break
-                
-            logger.info(f"测试批次 {i+1}/{len(batches)}，包含 {len(batch)} 个节点")
-            console.print(f"[cyan]测试批次 {i+1}/{len(batches)}，共 {len(batch)} 个节点[/cyan]")
+        以下节点需要重新测试：没有记录、记录已过期、结果不稳定（最近结果与成功率不一致）、
+        EWMA延迟接近超时阈值。记录新鲜且持续失败的节点直接视为无效。
+        
+        Args:
+            proxies: 代理节点列表
+            keys: 与proxies一一对应的节点标识
+            records: 节点标识 -> 历史记录
             
-            # 测试这一批节点
-            batch_results = await self.test_batch(batch)
-            valid_proxies.extend(batch_results)
+        Returns:
+            (复用结果的有效节点列表, 需要测试的节点列表)
+        """
+        now = time.time()
+        cutoff = self.timeout_ms * self.recheck_margin
+        
+        cached, to_probe = [], []
+        skipped_dead = 0
+        for proxy, key in zip(proxies, keys):
+            record = records.get(key)
+            if record is None or not self.history.is_fresh(record, now):
+                to_probe.append(proxy)
+            elif record['last_ok'] and record['success_rate'] >= 0.5 and \
+                    record['ewma_latency'] is not None and record['ewma_latency'] < cutoff:
+                proxy.update(record['result'])
+                cached.append(proxy)
+            elif not record['last_ok'] and record['success_rate'] < 0.5:
+                skipped_dead += 1
+            else:
+                to_probe.append(proxy)
+        
+        logger.info(f"延迟历史记录: 复用 {len(cached)} 个有效节点, 跳过 {skipped_dead} 个失效节点, 需要测试 {len(to_probe)} 个节点")
+        console.print(f"[cyan]复用历史结果 {len(cached) + skipped_dead} 个节点，需要测试 {len(to_probe)} 个节点[/cyan]")
+        return cached, to_probe
+    
+    async def _probe_window(self, proxies, task_status=None, top_k=None):
+        """以滑动窗口方式测试节点，按完成顺序逐个产出结果
+        
+        Args:
+            proxies: 代理节点列表
+            task_status: 任务状态字典，running为False时停止调度并取消在途探测
+            top_k: TopKTracker，由调用方写入结果；满足后不再启动新的探测，
+                并取消耗时已超过第K快延迟的在途探测
             
-            # 显示进度
-            console.print(f"[green]批次 {i+1} 完成，有效节点: {len(batch_results)}/{len(batch)}[/green]")
+        Yields:
+            (proxy, latency)
+        """
+        window = ConcurrencyWindow(
+            self.concurrent_tests,
+            minimum=self.min_concurrent,
+            maximum=self.max_concurrent,
+            adaptive=self.adaptive_concurrency,
+            failure_threshold=self.failure_threshold
+        )
+        
+        pending = set()
+        states = {}  # task -> _measure写入的状态
+        # 端点结果只在本轮测试内共享
+        endpoints = {} if self.endpoint_dedup else None
+        next_index = 0
+        try:
+            while (next_index < len(proxies) and not (top_k and top_k.satisfied)) or pending:
+                # 任务被停止或超过截止时间：finally中立即取消所有在途探测
+                if self._should_stop(task_status):
+                    break
+                
+                wait_timeout = None
+                if top_k and top_k.satisfied:
+                    # 已找到K个节点：排序延迟（第一次采样或其下界）已超过第K快延迟的在途探测不可能再进入前K，直接取消；
+                    # 内核RTT与事件循环的调度延迟无关，按内核RTT排序时只按采样结果判断
+                    now = time.monotonic()
+                    threshold = top_k.threshold / 1000
+                    deadlines = []
+                    for task in list(pending):
+                        state = states[task]
+                        first_sample = state.get('first_sample')
+                        bound_since = state.get('bound_since')
+                        if first_sample is not None:
+                            exceeded = first_sample / 1000 > threshold
+                        elif bound_since is not None:
+                            exceeded = now - bound_since > threshold
+                            if not exceeded:
+                                deadlines.append(bound_since + threshold)
+                        else:
+                            exceeded = False
+                        if exceeded:
+                            task.cancel()
+                            pending.discard(task)
+                            states.pop(task)
+                    if not pending:
+                        break
+                    wait_timeout = max(0, min(deadlines) - now) if deadlines else None
+                else:
+                    while next_index < len(proxies) and len(pending) < window.limit:
+                        state = {}
+                        task = asyncio.create_task(self._test_proxy(proxies[next_index], state, endpoints))
+                        pending.add(task)
+                        states[task] = state
+                        next_index += 1
+                
+                done, pending = await asyncio.wait(pending, timeout=self._poll_timeout(wait_timeout),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    states.pop(task, None)
+                    try:
+                        proxy, latency, outcome = task.result()
+                    except Exception as e:
+                        logger.error(f"测试节点时发生错误: {str(e)}")
+                        continue
+                    window.record(outcome)
+                    yield proxy, latency
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _probe_epoll(self, proxies, task_status=None, top_k=None):
+        """使用epoll后端测试节点，按完成顺序逐个产出结果
+        
+        先通过共享解析器并发解析所有节点，再交给探测线程中的EpollProber；
+        该后端只测TCP连接，不做协议握手。
+        
+        Args:
+            proxies: 代理节点列表
+            task_status: 任务状态字典，running为False时停止探测
+            top_k: TopKTracker，满足后停止探测
             
-            # 更新任务进度（如果提供了任务状态）
-            if task_status:
-                progress_value = int(60 + (i+1) / len(batches) * 30)  # 60%-90%之间更新进度
-                task_status['progress'] = min(progress_value, 90)
+        Yields:
+            (proxy, latency)
+        """
+        if self.protocol_probe:
+            logger.info("epoll后端只测试TCP连接，不进行协议握手")
+        
+        async def resolve(proxy):
+            server = proxy.get('server')
+            port = proxy.get('port')
+            if not self._is_valid_address(server) or not port:
+                return None
+            try:
+                addrinfo = await self.resolver.resolve(server, port)
+            except (socket.gaierror, OSError):
+                return None
+            return [(info[0], info[4]) for info in self._interleave_families(addrinfo)]
+        
+        # 解析阶段同样按轮询间隔检查停止和截止时间，无法解析的节点随完成顺序产出
+        lookups = {asyncio.ensure_future(resolve(proxy)): index for index, proxy in enumerate(proxies)}
+        pending = set(lookups)
+        resolved = {}
+        try:
+            while pending:
+                if self._should_stop(task_status):
+                    return
+                done, pending = await asyncio.wait(pending, timeout=self._poll_timeout())
+                for task in done:
+                    index = lookups[task]
+                    addresses = task.result()
+                    if addresses:
+                        resolved[index] = addresses
+                    else:
+                        yield proxies[index], -1
+        finally:
+            for task in pending:
+                task.cancel()
+        targets = sorted(resolved.items())
+        
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        prober = EpollProber(
+            min(self.timeout_ms / 1000, 2.0),
+            samples=self.samples,
+            retry_count=self.retry_count,
+            sample_interval=self.sample_interval_ms / 1000,
+            max_in_flight=self.epoll_max_in_flight
+        )
+        logger.info(f"epoll后端: 在途连接上限 {prober.max_in_flight}")
+        
+        def on_result(*result):
+            loop.call_soon_threadsafe(results.put_nowait, result)
+        
+        def run():
+            try:
+                prober.run(targets, on_result)
+            finally:
+                loop.call_soon_threadsafe(results.put_nowait, None)
+        
+        runner = loop.run_in_executor(None, run)
+        try:
+            while True:
+                if self._should_stop(task_status):
+                    break
+                if top_k and top_k.satisfied:
+                    break
+                try:
+                    result = await asyncio.wait_for(results.get(), self._poll_timeout())
+                except asyncio.TimeoutError:
+                    continue
+                if result is None:
+                    break
                 
-            # 每批次测试后休眠指定时间，避免连续大量请求
-            if i < len(batches) - 1:  # 如果不是最后一批
-                logger.info(f"等待 {self.batch_interval} 秒后开始下一批测试")
-                await asyncio.sleep(self.batch_interval)
+                index, samples, attempts, outcome, family, kernel_samples = result
+                proxy = proxies[index]
+                if not samples:
+                    yield proxy, -1
+                    continue
+                proxy['address_family'] = 'ipv6' if family == socket.AF_INET6 else 'ipv4'
+                proxy.update(self._summarize(samples, attempts, kernel_samples))
+                yield proxy, proxy['latency']
+        finally:
+            prober.stop()
+            await runner
+    
+    async def _probe_sharded(self, proxies, task_status=None, top_k=None):
+        """把节点分片到多个子进程测试，按到达顺序逐个产出结果
         
-        # 按延迟排序
-        valid_proxies.sort(key=lambda x: x.get('latency', float('inf')))
+        节点按轮转方式分片，使各进程拿到的快慢节点大致均衡。子进程只回传测试结果字段，
+        由主进程写回原始节点字典。
         
-        invalid_count = len(proxies) - len(valid_proxies)
-        logger.info(f"延迟测试完成: {len(valid_proxies)} 个有效节点, {invalid_count} 个无效节点")
+        Args:
+            proxies: 代理节点列表
+            task_status: 任务状态字典，running为False时终止子进程
+            top_k: TopKTracker，满足后终止子进程（子进程内的在途探测一并取消）
+            
+        Yields:
+            (proxy, latency)
+        """
+        workers = min(self.shard_workers, len(proxies))
+        logger.info(f"使用 {workers} 个进程分片测试 {len(proxies)} 个节点")
+        console.print(f"[cyan]使用 {workers} 个进程分片测试节点[/cyan]")
         
-        return valid_proxies 
\ No newline at end of file
+        # 子进程不再分片、不读写历史记录
+        shard_config = copy.deepcopy(self.config)
+        shard_latency_config = dict(shard_config.get('latency_test') or {})
+        shard_config['latency_test'] = shard_latency_config
+        shard_latency_config['shard_workers'] = 0
+        shard_latency_config['history'] = {'enable': False}
+        shard_latency_config['circuit_breaker'] = {'enable': False}
+        # 截止时间由主进程统一控制，到时直接终止子进程
+        shard_latency_config['deadline'] = 0
+        
+        # 使用spawn，避免在带事件循环和线程的进程（如Web UI）中fork
+        context = multiprocessing.get_context('spawn')
+        result_queue = context.Queue()
+        processes = []
+        for shard_index in range(workers):
+            indexes = list(range(shard_index, len(proxies), workers))
+            shard = [(index, proxies[index]) for index in indexes]
+            process = context.Process(target=_run_shard, args=(shard_config, shard, result_queue), daemon=True)
+            process.start()
+            processes.append(process)
+        
+        loop = asyncio.get_running_loop()
+        running = workers
+        try:
+            while running:
+                if self._should_stop(task_status):
+                    break
+                if top_k and top_k.satisfied:
+                    break
+                try:
+                    message = await loop.run_in_executor(None, result_queue.get, True, self._poll_timeout())
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes) and result_queue.empty():
+                        logger.error("分片测试进程异常退出")
+                        break
+                    continue
+                
+                if message is None:
+                    running -= 1
+                    continue
+                for index, latency, fields in message:
+                    proxy = proxies[index]
+                    proxy.update(fields)
+                    yield proxy, latency
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join(timeout=1)
+            result_queue.close()
+
+def _run_shard(config, shard, result_queue):
+    """分片子进程入口：在独立事件循环中测试一组节点，分批回传结果
+    
+    Args:
+        config: 程序配置
+        shard: [(index, proxy)] 列表
+        result_queue: 结果队列，每条消息为[(index, latency, 结果字段)]，结束时发送None
+    """
+    async def run():
+        tester = LatencyTester(config)
+        indexes = {id(proxy): index for index, proxy in shard}
+        buffer = []
+        last_flush = time.monotonic()
+        async for proxy, latency in tester._probe_window([proxy for _, proxy in shard]):
+            fields = {field: proxy[field] for field in RESULT_FIELDS if field in proxy}
+            buffer.append((indexes[id(proxy)], latency, fields))
+            if len(buffer) >= SHARD_FLUSH_SIZE or time.monotonic() - last_flush >= SHARD_FLUSH_INTERVAL:
+                result_queue.put(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+        if buffer:
+            result_queue.put(buffer)
+        tester.resolver.close()
+    
+    try:
+        asyncio.run(run())
+    except Exception as e:
+        logger.error(f"分片测试进程发生错误: {str(e)}")
+    finally:
+        result_queue.put(None)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+节点选择器 - 节点数量超过测试上限时，按历史表现、来源可靠性和分层规则挑选要测试的节点
+"""
+
+import math
+import random
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# 历史成功率低于该值的节点视为大概率失效，排在所有其他节点之后
+DEAD_SUCCESS_RATE = 0.2
+
+# 没有历史数据的来源使用的默认可靠性
+DEFAULT_SOURCE_RELIABILITY = 0.5
+
+class NodeSelector:
+    """节点选择器
+
+    - 有历史记录的节点按成功率、来源可靠性和EWMA延迟打分
+    - 从未测试过的节点保留一定比例的名额，按来源可靠性排序
+    - 在（来源, 协议类型）分层之间轮流选取，避免名额被单一来源或协议占满
+    """
+
+    def __init__(self, new_node_ratio=0.2, timeout_ms=2000):
+        """初始化选择器
+
+        Args:
+            new_node_ratio: 为从未测试过的节点保留的名额比例
+            timeout_ms: 延迟测试超时时间，用于把EWMA延迟归一化
+        """
+        self.new_node_ratio = new_node_ratio
+        self.timeout_ms = timeout_ms
+
+    def select(self, proxies, budget, keys=None, records=None):
+        """从节点列表中选出不超过budget个节点
+
+        Args:
+            proxies: 代理节点列表
+            budget: 最多选择的节点数
+            keys: 与proxies一一对应的节点标识（来自LatencyHistory.node_key）
+            records: 节点标识 -> 历史记录
+
+        Returns:
+            选中的节点列表
+        """
+        if len(proxies) <= budget:
+            return list(proxies)
+
+        records = records or {}
+        keys = keys or [None] * len(proxies)
+        reliability = self._source_reliability(proxies, keys, records)
+
+        known, unseen, dead = [], [], []
+        for proxy, key in zip(proxies, keys):
+            record = records.get(key) if key else None
+            source_score = reliability.get(proxy.get('_source'), DEFAULT_SOURCE_RELIABILITY)
+            if record is None:
+                # 随机扰动让同一来源的新节点在多次运行中轮流获得测试机会
+                unseen.append((source_score + random.uniform(0, 0.1), proxy))
+            elif record['success_rate'] < DEAD_SUCCESS_RATE:
+                dead.append((record['success_rate'], proxy))
+            else:
+                known.append((self._score(record, source_score), proxy))
+
+        new_quota = min(len(unseen), int(math.ceil(budget * self.new_node_ratio)))
+        known_quota = min(len(known), budget - new_quota)
+        # 一方不足时由另一方补齐
+        new_quota = min(len(unseen), budget - known_quota)
+
+        selected = self._stratified(known, known_quota) + self._stratified(unseen, new_quota)
+        if len(selected) < budget:
+            dead.sort(key=lambda item: item[0], reverse=True)
+            selected.extend(proxy for _, proxy in dead[:budget - len(selected)])
+
+        logger.info(f"节点选择: 历史有效 {known_quota} 个, 新节点 {new_quota} 个, "
+                    f"历史失效 {len(selected) - known_quota - new_quota} 个 (共 {len(proxies)} 个候选)")
+        return selected
+
+    def _score(self, record, source_score):
+        """有历史记录节点的得分，越高越优先"""
+        latency_score = 0.0
+        if record['ewma_latency'] is not None and self.timeout_ms > 0:
+            latency_score = max(0.0, 1 - record['ewma_latency'] / self.timeout_ms)
+        return 0.6 * record['success_rate'] + 0.25 * source_score + 0.15 * latency_score
+
+    def _source_reliability(self, proxies, keys, records):
+        """按来源统计已知节点的平均成功率"""
+        totals = defaultdict(float)
+        counts = defaultdict(int)
+        for proxy, key in zip(proxies, keys):
+            record = records.get(key) if key else None
+            if record is None:
+                continue
+            source = proxy.get('_source')
+            totals[source] += record['success_rate']
+            counts[source] += 1
+        return {source: totals[source] / counts[source] for source in counts}
+
+    def _stratified(self, scored, quota):
+        """在（来源, 协议类型）分层之间轮流选取得分最高的节点
+
+        Args:
+            scored: [(score, proxy)] 列表
+            quota: 选择数量
+
+        Returns:
+            选中的节点列表
+        """
+        if quota <= 0:
+            return []
+
+        strata = defaultdict(list)
+        for score, proxy in scored:
+            stratum = (proxy.get('_source'), str(proxy.get('type', '')).lower())
+            strata[stratum].append((score, proxy))
+
+        # 分层内按得分排序，然后按(层内名次, -得分)全局排序，相当于按得分轮流取各层的下一个节点
+        ranked = []
+        for members in strata.values():
+            members.sort(key=lambda item: item[0], reverse=True)
+            for rank, (score, proxy) in enumerate(members):
+                ranked.append((rank, -score, proxy))
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        return [proxy for _, _, proxy in ranked[:quota]]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+解析结果缓存 - 按订阅内容的摘要保存解析并校验过的配置，内容未变化时跳过YAML解析和节点校验
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本；解析或校验规则变化时加一，旧缓存自动失效
+FORMAT_VERSION = 1
+
+class ParsedConfigCache:
+    """以内容SHA-256为键、pickle序列化的配置缓存
+
+    每个摘要对应一个 <digest>.pickle 文件。命中时更新文件修改时间，
+    超过max_age未被使用的缓存在初始化时删除。
+    """
+
+    def __init__(self, directory, max_age=7 * 24 * 3600):
+        """初始化缓存
+
+        Args:
+            directory: 缓存目录
+            max_age: 缓存未被使用多久后删除（秒）
+        """
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self.reset_stats()
+        self._prune()
+
+    def reset_stats(self):
+        """清空本轮统计"""
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def digest(content):
+        """订阅内容的摘要"""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        try:
+            entries = os.scandir(self.directory)
+        except OSError:
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.pickle') and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+
+    def get(self, digest):
+        """读取缓存的配置
+
+        Args:
+            digest: 内容摘要
+
+        Returns:
+            配置字典（每次返回新的对象，可以直接修改）；未命中时返回None
+        """
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                version, config = pickle.load(f)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            logger.debug(f"解析缓存已损坏: {path}, 错误: {str(e)}")
+            self.stats['misses'] += 1
+            return None
+        if version != FORMAT_VERSION:
+            self.stats['misses'] += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats['hits'] += 1
+        return config
+
+    def put(self, digest, config):
+        """保存解析并校验过的配置
+
+        Args:
+            digest: 内容摘要
+            config: 配置字典
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((FORMAT_VERSION, config), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(digest))
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"无法写入解析缓存: {str(e)}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+协议握手探测 - 在TCP连接建立后按节点类型做一次协议级往返，确认代理服务真实可用
+"""
+
+import logging
+import asyncio
+import ssl
+import time
+
+logger = logging.getLogger(__name__)
+
+class ProbeError(Exception):
+    """协议握手失败"""
+
+class HandshakeProbe:
+    """握手探测基类
+
+    子类通过 uses_tls 决定是否先进行TLS握手，通过 exchange 完成协议往返。
+    基类本身只做（可选的）TLS握手。
+    """
+
+    def __init__(self, timeout, ssl_context=None):
+        """初始化探测
+
+        Args:
+            timeout: 握手超时时间（秒）
+            ssl_context: 自定义SSL上下文，默认不校验证书
+        """
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+
+    def uses_tls(self, proxy):
+        """节点是否需要TLS握手"""
+        return bool(proxy.get('tls'))
+
+    def server_name(self, proxy):
+        """TLS握手使用的SNI"""
+        return proxy.get('sni') or proxy.get('servername') or proxy.get('server')
+
+    def _make_ssl_context(self, proxy):
+        if self.ssl_context is not None:
+            return self.ssl_context
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        alpn = proxy.get('alpn')
+        if isinstance(alpn, list) and alpn:
+            try:
+                context.set_alpn_protocols([str(item) for item in alpn])
+            except (NotImplementedError, ssl.SSLError):
+                pass
+        return context
+
+    async def exchange(self, reader, writer, proxy):
+        """完成协议往返，失败时抛出ProbeError
+
+        Args:
+            reader: 流读取器
+            writer: 流写入器
+            proxy: 代理节点字典
+        """
+
+    async def run(self, sock, proxy):
+        """在已连接的socket上执行握手探测，完成后关闭连接
+
+        Args:
+            sock: 已连接的非阻塞socket
+            proxy: 代理节点字典
+
+        Returns:
+            握手耗时（毫秒）
+
+        Raises:
+            ProbeError: 协议响应不符合预期，或节点在握手完成前关闭连接
+            asyncio.TimeoutError: 握手超时
+            OSError: 连接被重置等网络错误
+        """
+        start_ns = time.perf_counter_ns()
+        self._handed_over = False
+        try:
+            return await asyncio.wait_for(self._handshake(sock, proxy, start_ns), self.timeout)
+        finally:
+            # socket交给传输层后由传输层关闭；在这里提前关闭会让仍注册在事件循环中的传输
+            # 与之后复用同一fd的新socket冲突
+            if not self._handed_over:
+                sock.close()
+
+    async def _handshake(self, sock, proxy, start_ns):
+        kwargs = {}
+        if self.uses_tls(proxy):
+            kwargs = {
+                'ssl': self._make_ssl_context(proxy),
+                'server_hostname': self.server_name(proxy),
+                'ssl_handshake_timeout': self.timeout
+            }
+        self._handed_over = True
+        reader, writer = await asyncio.open_connection(sock=sock, **kwargs)
+        try:
+            await self.exchange(reader, writer, proxy)
+            return int((time.perf_counter_ns() - start_ns) / 1_000_000)
+        except EOFError:
+            # readexactly等读到连接关闭时抛出IncompleteReadError，按协议失败处理以便重试
+            raise ProbeError("节点在握手完成前关闭了连接")
+        finally:
+            # 直接中止连接，不等待TLS close_notify往返
+            writer.transport.abort()
+
+class TLSProbe(HandshakeProbe):
+    """TLS握手探测，用于trojan以及开启tls的vmess/vless"""
+
+    def uses_tls(self, proxy):
+        return proxy.get('type', '').lower() == 'trojan' or bool(proxy.get('tls'))
+
+class SOCKS5Probe(HandshakeProbe):
+    """SOCKS5方法协商探测"""
+
+    def uses_tls(self, proxy):
+        return proxy.get('type', '').lower() == 'socks5-tls' or bool(proxy.get('tls'))
+
+    async def exchange(self, reader, writer, proxy):
+        # 有用户名时同时声明“无认证”和“用户名/密码”两种方法
+        if proxy.get('username'):
+            writer.write(b'\x05\x02\x00\x02')
+        else:
+            writer.write(b'\x05\x01\x00')
+        await writer.drain()
+
+        reply = await reader.readexactly(2)
+        if reply[0] != 0x05:
+            raise ProbeError(f"无效的SOCKS5响应: {reply!r}")
+
+class HTTPConnectProbe(HandshakeProbe):
+    """HTTP CONNECT往返探测"""
+
+    def __init__(self, timeout, ssl_context=None, target='www.gstatic.com:443'):
+        """初始化探测
+
+        Args:
+            timeout: 握手超时时间（秒）
+            ssl_context: 自定义SSL上下文
+            target: CONNECT请求的目标地址
+        """
+        super().__init__(timeout, ssl_context)
+        self.target = target
+
+    async def exchange(self, reader, writer, proxy):
+        request = f"CONNECT {self.target} HTTP/1.1\r\nHost: {self.target}\r\n\r\n"
+        writer.write(request.encode('ascii'))
+        await writer.drain()
+
+        # 任何HTTP状态行（包括407）都说明代理服务在工作
+        status_line = await reader.readline()
+        if not status_line.startswith(b'HTTP/1.'):
+            raise ProbeError(f"无效的HTTP响应: {status_line[:32]!r}")
+
+# 节点类型 -> 探测类，可通过 register_probe 扩展
+PROBES = {
+    'trojan': TLSProbe,
+    'vmess': TLSProbe,
+    'vless': TLSProbe,
+    'socks5': SOCKS5Probe,
+    'socks5-tls': SOCKS5Probe,
+    'http': HTTPConnectProbe,
+}
+
+def register_probe(proxy_type, probe_class):
+    """注册节点类型对应的握手探测
+
+    Args:
+        proxy_type: 节点类型
+        probe_class: HandshakeProbe 子类
+    """
+    PROBES[proxy_type.lower()] = probe_class
+
+def get_probe(proxy, timeout, connect_target=None):
+    """获取节点对应的握手探测
+
+    Args:
+        proxy: 代理节点字典
+        timeout: 握手超时时间（秒）
+        connect_target: HTTP CONNECT的目标地址
+
+    Returns:
+        HandshakeProbe 实例；该类型没有可用探测时返回None
+    """
+    probe_class = PROBES.get(str(proxy.get('type', '')).lower())
+    if probe_class is None:
+        return None
+
+    if issubclass(probe_class, HTTPConnectProbe) and connect_target:
+        probe = probe_class(timeout, target=connect_target)
+    else:
+        probe = probe_class(timeout)
+
+    # 只有在需要TLS时才对TLS类节点做握手，否则没有可比较的协议往返
+    if type(probe).exchange is HandshakeProbe.exchange and not probe.uses_tls(proxy):
+        return None
+    return probe
@@ -57,8 +57,8 @@ class ProxyMerger:
         
         for config in configs:
             try:
-                # 保存第一个有效配置
-                if first_config is None and isinstance(config, dict):
+                # 保存第一个完整的有效配置（_partial表示只提取了proxies，不能作为模板）
+                if first_config is None and isinstance(config, dict) and not config.get('_partial'):
                     first_config = config
                 
                 # 提取代理节点
@@ -71,15 +71,20 @@ class ProxyMerger:
                     logger.warning("配置中没有找到代理节点")
                     continue
                 
-                # 过滤有效的代理节点
-                valid_proxies = []
-                for proxy in proxies:
-                    if self._is_valid_proxy(proxy):
-                        valid_proxies.append(proxy)
-                    else:
-                        total_invalid += 1
+                # 过滤有效的代理节点；带_invalid字段的配置在抓取时已校验过（来自解析缓存）
+                if '_invalid' in config:
+                    valid_proxies, invalid = proxies, config['_invalid']
+                else:
+                    valid_proxies, invalid = self.validate_proxies(proxies)
+                total_invalid += invalid
+                
+                # 记录节点来源（下划线开头的字段为内部字段，输出时移除）
+                source = config.get('_source')
+                if source:
+                    for proxy in valid_proxies:
+                        proxy['_source'] = source
                 
-                logger.info(f"从配置中提取了 {len(valid_proxies)} 个有效代理节点 (忽略 {len(proxies) - len(valid_proxies)} 个无效节点)")
+                logger.info(f"从配置中提取了 {len(valid_proxies)} 个有效代理节点 (忽略 {invalid} 个无效节点)")
                 all_proxies.extend(valid_proxies)
             except Exception as e:
                 logger.error(f"处理配置时发生错误: {str(e)}")
@@ -101,6 +106,18 @@ class ProxyMerger:
         logger.info(f"合并后共有 {len(all_proxies)} 个代理节点 (总共忽略 {total_invalid} 个无效节点)")
         return all_proxies, first_config
     
+    def validate_proxies(self, proxies):
+        """过滤有效的代理节点
+        
+        Args:
+            proxies: 代理节点列表
+            
+        Returns:
+            (有效节点列表, 无效节点数)
+        """
+        valid_proxies = [proxy for proxy in proxies if self._is_valid_proxy(proxy)]
+        return valid_proxies, len(proxies) - len(valid_proxies)
+    
     def _is_valid_proxy(self, proxy):
         """检查代理节点是否有效
         
@@ -170,6 +187,8 @@ class ProxyMerger:
         proxy_copy.pop('name', None)  # 名称可能会被修改，但节点本身可能相同
         proxy_copy.pop('udp', None)   # UDP支持不影响节点唯一性
         proxy_copy.pop('tfo', None)   # TCP Fast Open不影响节点唯一性
+        for key in [k for k in proxy_copy if str(k).startswith('_')]:
+            proxy_copy.pop(key)       # 内部字段（如来源）不影响节点唯一性
         
         # 将代理信息转换为JSON字符串，然后生成哈希
         try:
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+真实延迟测试 - 经节点向测试地址发起一次HTTP请求，测量收到响应状态行的时间，与Clash客户端的延迟测试方式一致；
+同样的隧道也用于带宽测试
+支持socks5、http（CONNECT）和shadowsocks（AEAD加密）节点
+"""
+
+import os
+import time
+import asyncio
+import base64
+import socket
+import struct
+import hashlib
+import logging
+from urllib.parse import urlsplit
+
+from utils.probes import ProbeError, HandshakeProbe
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:
+    AESGCM = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'http://www.gstatic.com/generate_204'
+
+# shadowsocks AEAD加密方式 -> (密钥长度, 算法)
+SS_CIPHERS = {
+    'aes-128-gcm': (16, 'aes-gcm'),
+    'aes-192-gcm': (24, 'aes-gcm'),
+    'aes-256-gcm': (32, 'aes-gcm'),
+    'chacha20-ietf-poly1305': (32, 'chacha20-poly1305'),
+    'chacha20-poly1305': (32, 'chacha20-poly1305'),
+}
+
+SS_TAG_SIZE = 16
+SS_MAX_PAYLOAD = 0x3FFF
+
+# 状态行的最大长度，超过仍未读到换行视为无效响应
+MAX_STATUS_LINE = 1024
+
+def _evp_bytes_to_key(password, key_size):
+    """OpenSSL EVP_BytesToKey（MD5），shadowsocks用它从密码生成主密钥"""
+    key, previous = b'', b''
+    while len(key) < key_size:
+        previous = hashlib.md5(previous + password).digest()
+        key += previous
+    return key[:key_size]
+
+def socks_address(host, port):
+    """按SOCKS5地址格式（ATYP + 地址 + 端口）编码目标地址"""
+    for family, atyp in ((socket.AF_INET, b'\x01'), (socket.AF_INET6, b'\x04')):
+        try:
+            return atyp + socket.inet_pton(family, host) + struct.pack('!H', port)
+        except (OSError, ValueError):
+            continue
+    encoded = host.encode('idna')
+    return b'\x03' + bytes([len(encoded)]) + encoded + struct.pack('!H', port)
+
+class ShadowsocksCipher:
+    """shadowsocks AEAD单方向的加解密状态，每个方向各自使用一个盐和递增的nonce"""
+
+    def __init__(self, method, password, salt=None):
+        """初始化加解密状态
+
+        Args:
+            method: 加密方式，见SS_CIPHERS
+            password: 密码
+            salt: 对方发来的盐；为None时生成新的盐（用于加密方向）
+        """
+        if AESGCM is None:
+            raise ProbeError("shadowsocks真实延迟测试需要安装cryptography")
+        key_size, algorithm = SS_CIPHERS[method]
+        self.salt = salt or os.urandom(key_size)
+        master_key = _evp_bytes_to_key(password.encode(), key_size)
+        subkey = HKDF(algorithm=hashes.SHA1(), length=key_size, salt=self.salt, info=b'ss-subkey').derive(master_key)
+        self._aead = AESGCM(subkey) if algorithm == 'aes-gcm' else ChaCha20Poly1305(subkey)
+        self._nonce = 0
+
+    @staticmethod
+    def salt_size(method):
+        return SS_CIPHERS[method][0]
+
+    def _next_nonce(self):
+        nonce = self._nonce.to_bytes(12, 'little')
+        self._nonce += 1
+        return nonce
+
+    def encrypt(self, data):
+        """把数据切分为AEAD块并加密：[加密的长度][加密的数据]"""
+        chunks = []
+        for i in range(0, len(data), SS_MAX_PAYLOAD):
+            payload = data[i:i + SS_MAX_PAYLOAD]
+            chunks.append(self._aead.encrypt(self._next_nonce(), struct.pack('!H', len(payload)), None))
+            chunks.append(self._aead.encrypt(self._next_nonce(), payload, None))
+        return b''.join(chunks)
+
+    def _decrypt(self, data):
+        try:
+            return self._aead.decrypt(self._next_nonce(), data, None)
+        except InvalidTag:
+            raise ProbeError("shadowsocks解密失败，密码或加密方式不正确")
+
+    async def read_chunk(self, reader):
+        """读取并解密一个AEAD块"""
+        length = struct.unpack('!H', self._decrypt(await reader.readexactly(2 + SS_TAG_SIZE)))[0]
+        return self._decrypt(await reader.readexactly((length & SS_MAX_PAYLOAD) + SS_TAG_SIZE))
+
+class _StreamChannel:
+    """已建立隧道的明文连接"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def recv(self):
+        data = await self.reader.read(4096)
+        if not data:
+            raise ProbeError("连接被节点关闭")
+        return data
+
+class _ShadowsocksChannel:
+    """shadowsocks AEAD连接，第一次发送时附带盐和目标地址"""
+
+    def __init__(self, reader, writer, method, password, host, port):
+        self.reader = reader
+        self.writer = writer
+        self.method = method
+        self.password = password
+        self._encryptor = ShadowsocksCipher(method, password)
+        self._decryptor = None
+        self._header = self._encryptor.salt, socks_address(host, port)
+
+    async def send(self, data):
+        prefix = b''
+        if self._header:
+            salt, address = self._header
+            prefix, data = salt, address + data
+            self._header = None
+        self.writer.write(prefix + self._encryptor.encrypt(data))
+        await self.writer.drain()
+
+    async def recv(self):
+        if self._decryptor is None:
+            salt = await self.reader.readexactly(ShadowsocksCipher.salt_size(self.method))
+            self._decryptor = ShadowsocksCipher(self.method, self.password, salt)
+        return await self._decryptor.read_chunk(self.reader)
+
+class RealDelayProbe(HandshakeProbe):
+    """经节点请求测试地址的探测，耗时为从TCP连接建立到收到HTTP状态行"""
+
+    def __init__(self, timeout, ssl_context=None, url=DEFAULT_URL):
+        """初始化探测
+
+        Args:
+            timeout: 探测超时时间（秒）
+            ssl_context: 自定义SSL上下文（节点开启tls时使用）
+            url: 测试地址，只支持http://
+        """
+        super().__init__(timeout, ssl_context)
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise ValueError(f"真实延迟测试只支持http://地址: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        host_header = self.host if self.port == 80 else f"{self.host}:{self.port}"
+        self.request = (f"GET {path} HTTP/1.1\r\nHost: {host_header}\r\n"
+                        f"User-Agent: clash-test\r\nConnection: close\r\n\r\n").encode('ascii')
+
+    @staticmethod
+    def supports(proxy):
+        """节点类型是否支持真实延迟测试"""
+        proxy_type = str(proxy.get('type', '')).lower()
+        if proxy_type in ('socks5', 'http'):
+            return True
+        if proxy_type == 'ss':
+            # 不支持插件（obfs/v2ray-plugin）和非AEAD加密方式
+            return AESGCM is not None and not proxy.get('plugin') and \
+                str(proxy.get('cipher', '')).lower() in SS_CIPHERS
+        return False
+
+    def uses_tls(self, proxy):
+        return str(proxy.get('type', '')).lower() != 'ss' and bool(proxy.get('tls'))
+
+    async def open_channel(self, reader, writer, proxy):
+        """经节点建立到测试地址的隧道
+
+        Returns:
+            具有 send(data) / recv() 方法的连接
+        """
+        proxy_type = str(proxy.get('type', '')).lower()
+        if proxy_type == 'ss':
+            return _ShadowsocksChannel(reader, writer, str(proxy.get('cipher')).lower(),
+                                       str(proxy.get('password', '')), self.host, self.port)
+        try:
+            if proxy_type == 'socks5':
+                await self._socks5_connect(reader, writer, proxy)
+            else:
+                await self._http_connect(reader, writer, proxy)
+        except EOFError:
+            raise ProbeError("节点在建立隧道时关闭了连接")
+        return _StreamChannel(reader, writer)
+
+    async def exchange(self, reader, writer, proxy):
+        channel = await self.open_channel(reader, writer, proxy)
+        try:
+            await channel.send(self.request)
+            response = b''
+            while b'\n' not in response and len(response) < MAX_STATUS_LINE:
+                response += await channel.recv()
+        except EOFError:
+            raise ProbeError("节点在返回响应前关闭了连接")
+        if not response.startswith(b'HTTP/1.'):
+            raise ProbeError(f"无效的HTTP响应: {response[:32]!r}")
+
+    async def _socks5_connect(self, reader, writer, proxy):
+        username = proxy.get('username')
+        writer.write(b'\x05\x02\x00\x02' if username else b'\x05\x01\x00')
+        await writer.drain()
+        version, method = await reader.readexactly(2)
+        if version != 0x05 or method == 0xFF:
+            raise ProbeError(f"SOCKS5方法协商失败: {method}")
+        if method == 0x02:
+            user = str(username or '').encode()
+            password = str(proxy.get('password', '')).encode()
+            writer.write(b'\x01' + bytes([len(user)]) + user + bytes([len(password)]) + password)
+            await writer.drain()
+            _, status = await reader.readexactly(2)
+            if status != 0:
+                raise ProbeError("SOCKS5认证失败")
+
+        writer.write(b'\x05\x01\x00' + socks_address(self.host, self.port))
+        await writer.drain()
+        _, reply, _, atyp = await reader.readexactly(4)
+        if reply != 0:
+            raise ProbeError(f"SOCKS5 CONNECT失败: {reply}")
+        # 跳过绑定地址
+        if atyp == 0x01:
+            await reader.readexactly(4 + 2)
+        elif atyp == 0x04:
+            await reader.readexactly(16 + 2)
+        else:
+            length = (await reader.readexactly(1))[0]
+            await reader.readexactly(length + 2)
+
+    async def _http_connect(self, reader, writer, proxy):
+        target = f"{self.host}:{self.port}"
+        request = f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n"
+        if proxy.get('username'):
+            credentials = f"{proxy.get('username')}:{proxy.get('password', '')}".encode()
+            request += f"Proxy-Authorization: Basic {base64.b64encode(credentials).decode()}\r\n"
+        writer.write((request + "\r\n").encode('ascii'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/1.') or parts[1] != b'200':
+            raise ProbeError(f"HTTP CONNECT失败: {status_line[:32]!r}")
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+class ThroughputProbe(RealDelayProbe):
+    """带宽探测：经节点下载测试地址，统计收到第一块数据之后的持续下载速度"""
+
+    def __init__(self, timeout, ssl_context=None, url=DEFAULT_URL, max_bytes=1 << 20, duration=5.0):
+        """初始化探测
+
+        Args:
+            timeout: 建立隧道加下载的总超时时间（秒）
+            ssl_context: 自定义SSL上下文（节点开启tls时使用）
+            url: 下载地址，只支持http://
+            max_bytes: 最多下载的字节数
+            duration: 从收到第一块数据起最多下载的时间（秒）
+        """
+        super().__init__(timeout, ssl_context, url)
+        self.max_bytes = max_bytes
+        self.duration = duration
+        self.received = 0
+        self.rate = None
+
+    async def exchange(self, reader, writer, proxy):
+        channel = await self.open_channel(reader, writer, proxy)
+        try:
+            await channel.send(self.request)
+            first = await channel.recv()
+        except EOFError:
+            raise ProbeError("节点在返回响应前关闭了连接")
+        if not first.startswith(b'HTTP/1.'):
+            raise ProbeError(f"无效的HTTP响应: {first[:32]!r}")
+
+        # 第一块数据包含首字节延迟，不计入持续下载速度
+        first_at = time.perf_counter()
+        deadline = first_at + self.duration
+        received = 0
+        while len(first) + received < self.max_bytes:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                received += len(await asyncio.wait_for(channel.recv(), remaining))
+            except (asyncio.TimeoutError, ProbeError, EOFError):
+                # 超过下载时间或服务端传输完毕
+                break
+
+        elapsed = time.perf_counter() - first_at
+        self.received = received
+        if received and elapsed > 0:
+            self.rate = round(received / 1024 / elapsed, 1)
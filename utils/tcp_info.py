@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TCP_INFO读取 - 从已连接的socket读取内核测得的RTT，不受事件循环调度延迟影响
+"""
+
+import socket
+import struct
+
+# 只有Linux提供TCP_INFO
+TCP_INFO = getattr(socket, 'TCP_INFO', None)
+
+# struct tcp_info 开头部分：8个u8字段，随后依次为 rto, ato, snd_mss, rcv_mss, unacked, sacked, lost,
+# retrans, fackets, last_data_sent, last_ack_sent, last_data_recv, last_ack_recv, pmtu,
+# rcv_ssthresh, rtt, rttvar（u32，RTT单位为微秒）
+_TCP_INFO_HEAD = struct.Struct('=8B17I')
+_RTT_INDEX = 8 + 15
+_RTTVAR_INDEX = 8 + 16
+
+def kernel_rtt(sock):
+    """读取内核为该连接估计的RTT
+
+    连接刚建立时内核已经用SYN/SYN-ACK往返初始化了RTT估计。
+
+    Args:
+        sock: 已连接的TCP socket
+
+    Returns:
+        (rtt, rttvar)，单位毫秒；平台不支持或读取失败时返回None
+    """
+    if TCP_INFO is None:
+        return None
+    try:
+        data = sock.getsockopt(socket.IPPROTO_TCP, TCP_INFO, _TCP_INFO_HEAD.size)
+    except OSError:
+        return None
+    if len(data) < _TCP_INFO_HEAD.size:
+        return None
+    fields = _TCP_INFO_HEAD.unpack_from(data)
+    rtt = fields[_RTT_INDEX]
+    if rtt == 0:
+        return None
+    return rtt / 1000, fields[_RTTVAR_INDEX] / 1000
@@ -227,9 +227,25 @@ async def run_merger_task():
             add_log('任务已被取消，保存已处理的节点', "WARNING")
             return False
             
-        # 修改为由latency_tester返回已测试节点的中间结果
-        tested_proxies = await latency_tester.test_all_proxies(unique_proxies, TASK_STATUS)
+        # 逐个接收测试结果，实时更新进度；中途停止或出错时已测试的有效节点仍会保存
+        async for proxy, latency in latency_tester.stream(unique_proxies, TASK_STATUS):
+            if latency_tester.is_valid_latency(latency, proxy):
+                tested_proxies.append(proxy)
+            
+            stats = latency_tester.stats
+            TASK_STATUS['progress'] = min(int(60 + stats['completed'] / stats['total'] * 30), 90)
+            TASK_STATUS['message'] = (f"正在测试节点延迟... {stats['completed']}/{stats['total']}，"
+                                      f"有效 {stats['valid']}，{latency_tester.throughput():.1f} 个/秒")
         
+        tested_proxies.sort(key=latency_tester.sort_key)
+
+        # 对排名靠前的节点做带宽测试（需在配置中启用）
+        if latency_tester.throughput_url and TASK_STATUS['running'] and tested_proxies:
+            TASK_STATUS['message'] = '正在测试节点带宽...'
+            add_log('正在测试排名靠前节点的带宽...', "INFO")
+            await latency_tester.measure_throughput(tested_proxies, TASK_STATUS)
+            tested_proxies.sort(key=latency_tester.sort_key)
+
         # 检查任务是否被取消
         if not TASK_STATUS['running']:
             # 如果任务被取消但已有部分测试结果，则保存这些结果
@@ -242,6 +258,8 @@ async def run_merger_task():
                 TASK_STATUS['last_run'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             return False
             
+        if latency_tester.stop_reason == 'deadline':
+            add_log(f'延迟测试超过时间上限，跳过 {latency_tester.stats["skipped"]} 个未测试的节点', "WARNING")
         add_log(f'延迟测试完成，有效节点数: {len(tested_proxies)}', "INFO")
         
         # 5. 生成最终配置文件